@@ -26,6 +26,6 @@ available at ****.
 
 __version__ = '0.0.2-1'
 
-from . import exact, read, utils #, interpolation
+from . import exact, read, utils, interpolation
 
-__all__ = (['exact', 'read', 'utils'])
+__all__ = (['exact', 'read', 'utils', 'interpolation'])
@@ -19,9 +19,11 @@ except OSError:
 from .exact import (shock, shock_sr, sedov, polytrope,
                     toystar1D, toystar2D, gresho, rhoh,
                     torus, ringspread, dustywave, rochelobe,
-                    cshock, planetdisc, bondi)
+                    cshock, planetdisc, bondi, mhdshock)
+from .cache import enable_cache, disable_cache, clear_cache, cache_info
 
 __all__ = ['shock', 'shock_sr', 'sedov', 'polytrope',
            'toystar1D', 'toystar2D', 'gresho', 'rhoh',
            'torus', 'ringspread', 'dustywave', 'rochelobe',
-           'cshock', 'planetdisc', 'bondi']
+           'cshock', 'planetdisc', 'bondi', 'mhdshock',
+           'enable_cache', 'disable_cache', 'clear_cache', 'cache_info']
@@ -0,0 +1,267 @@
+"""
+An opt-in cache for the exact solutions.
+
+Comparing every dump of a run against the same exact solution recomputes
+it over and over. Once enabled with enable_cache, results are kept in
+memory, keyed on the function, its parameters and a hash of the input
+grid, and optionally also stored on disk so they survive between
+sessions.
+"""
+
+import functools
+import hashlib
+import inspect
+import os
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'disk_hits', 'misses', 'size',
+                                     'maxsize', 'eviction', 'cachedir'])
+
+
+class SolutionCache:
+    """In-memory cache of exact solutions, with an optional disk tier.
+
+    Parameters
+    ----------
+    maxsize
+        Maximum number of solutions kept in memory.
+    eviction
+        'lru' to evict the least recently used solution when the cache is
+        full, or 'fifo' to evict the oldest one.
+    cachedir
+        Optional directory in which solutions are also stored as .npz
+        files. Solutions evicted from memory are then reloaded from disk.
+    """
+
+    def __init__(self, maxsize=128, eviction='lru', cachedir=None):
+        if eviction not in ['lru', 'fifo']:
+            raise ValueError("eviction must be 'lru' or 'fifo'.")
+
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1.")
+
+        if cachedir is not None:
+            os.makedirs(cachedir, exist_ok=True)
+
+        self.maxsize = maxsize
+        self.eviction = eviction
+        self.cachedir = cachedir
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Return the solution stored under key, or None. """
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                if self.eviction == 'lru':
+                    self._entries.move_to_end(key)
+                return self._entries[key]
+
+        value = self._load(key)
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+
+            self.disk_hits += 1
+            self._insert(key, value)
+            return value
+
+    def put(self, key, value):
+        """ Store the solution value under key. """
+        with self._lock:
+            self._insert(key, value)
+        self._save(key, value)
+
+    def clear(self, disk=False):
+        """ Remove every solution from memory, and from disk if disk=True. """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+        if disk and self.cachedir is not None:
+            for filename in os.listdir(self.cachedir):
+                if filename.endswith('.npz'):
+                    os.remove(os.path.join(self.cachedir, filename))
+
+    def info(self):
+        return CacheInfo(self.hits, self.disk_hits, self.misses,
+                         len(self._entries), self.maxsize, self.eviction,
+                         self.cachedir)
+
+    def _insert(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.cachedir, key + '.npz')
+
+    def _save(self, key, value):
+        if self.cachedir is None:
+            return
+
+        if isinstance(value, dict):
+            names, values = list(value), np.stack(list(value.values()))
+        else:
+            names, values = [], value
+
+        # Write to a temporary file first, so other processes never see
+        # a partly written solution
+        fd, tmppath = tempfile.mkstemp(suffix='.npz', dir=self.cachedir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, names=np.array(names, dtype=str), values=values)
+            os.replace(tmppath, self._path(key))
+        except BaseException:
+            os.remove(tmppath)
+            raise
+
+    def _load(self, key):
+        if self.cachedir is None or not os.path.exists(self._path(key)):
+            return None
+
+        try:
+            with np.load(self._path(key)) as f:
+                names, values = list(f['names']), f['values']
+        except (OSError, ValueError, KeyError):
+            # Ignore unreadable files, the solution is then recomputed
+            return None
+
+        values.flags.writeable = False
+
+        if len(names) > 0:
+            return dict(zip(names, values))
+        return values
+
+
+_cache = None
+
+
+def enable_cache(maxsize=128, eviction='lru', cachedir=None):
+    """Cache the results of the exact solutions.
+
+    Parameters are as for SolutionCache. Calling enable_cache again
+    replaces the existing cache.
+    """
+    global _cache
+    _cache = SolutionCache(maxsize=maxsize, eviction=eviction, cachedir=cachedir)
+
+
+def disable_cache():
+    """ Stop caching the exact solutions and drop the in-memory cache. """
+    global _cache
+    _cache = None
+
+
+def clear_cache(disk=False):
+    """ Empty the cache, and the disk tier if disk=True. """
+    if _cache is not None:
+        _cache.clear(disk=disk)
+
+
+def cache_info():
+    """ Return hit/miss statistics of the cache, or None if it is disabled. """
+    if _cache is None:
+        return None
+    return _cache.info()
+
+
+def cached(function):
+    """Decorator that puts the exact solution function behind the cache.
+
+    The first argument of function is the input grid, and the keyword
+    argument out is not part of the key, since it only says where the
+    result is written.
+    """
+
+    signature = inspect.signature(function)
+    grid_name = list(signature.parameters)[0]
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _cache is None:
+            return function(*args, **kwargs)
+
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = bound.arguments
+
+        out = arguments.pop('out', None)
+        grid = np.ascontiguousarray(arguments.pop(grid_name), dtype=np.float64)
+
+        key = _make_key(function.__name__, arguments, grid)
+
+        value = _cache.get(key)
+        if value is None:
+            value = function(*args, **kwargs)
+            _cache.put(key, _freeze(value))
+            return value
+
+        return _thaw(value, out)
+
+    return wrapper
+
+
+def _make_key(name, arguments, grid):
+    """ Hash the function name, its parameters and the input grid. """
+    key = hashlib.sha1()
+    key.update(name.encode('utf-8'))
+    key.update(repr(sorted((k, _hashable(v)) for k, v in arguments.items())).encode('utf-8'))
+    key.update(repr(grid.shape).encode('utf-8'))
+    key.update(grid.data)
+    return key.hexdigest()
+
+
+def _hashable(value):
+    """ Turn a parameter into something with a stable repr. """
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        return ('ndarray', value.dtype.str, value.shape,
+                hashlib.sha1(value.data).hexdigest())
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _freeze(value):
+    """ Copy a result into read-only arrays for storing in the cache. """
+    if isinstance(value, dict):
+        frozen = np.stack(list(value.values()))
+        frozen.flags.writeable = False
+        return dict(zip(value, frozen))
+
+    frozen = np.array(value, copy=True)
+    frozen.flags.writeable = False
+    return frozen
+
+
+def _thaw(value, out):
+    """ Copy a cached result, into out if it is given. """
+    if isinstance(value, dict):
+        values = list(value.values())
+        if out is not None:
+            out = out.reshape((len(values),) + values[0].shape)
+        return dict(zip(value, np.stack(values, out=out)))
+
+    if out is not None:
+        out = out.reshape(value.shape)
+        out[...] = value
+        return out
+
+    return value.copy()
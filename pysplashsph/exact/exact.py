@@ -1,10 +1,11 @@
 import os.path
 from pathlib import Path
-from numpy.ctypeslib import as_array
+import numpy as np
 
-from ctypes import c_int, c_double, c_bool, byref
+from ctypes import c_int, c_double, c_bool, byref, POINTER
 from . import _libexact as libexact
 from ..utils import stdchannel_redirected
+from .cache import cached
 
 
 def checkfmt(str):
@@ -12,11 +13,115 @@ def checkfmt(str):
 
 def check_error(ierr, module):
     if type(ierr) is c_int:
-        ierr = c_int.value
+        ierr = ierr.value
     if ierr == 1:
         print("Error in " + str(module) + ".")
         exit(1)
 
+def _input_array(x, copy=False):
+    """ Return x as a contiguous float64 array, copying only if needed.
+
+    x can be any array-like of any shape; the Fortran routines see it as a
+    flat array of x.size values. Use copy=True for routines that write
+    into their input grid.
+    """
+    if copy:
+        return np.array(x, dtype=np.float64, order='C')
+    return np.ascontiguousarray(x, dtype=np.float64)
+
+def _output_array(x, out, leading=()):
+    """ Return the array the Fortran routine writes its result into.
+
+    The array has shape leading + x.shape, so it can hold several results
+    one after the other.
+    """
+    shape = tuple(leading) + x.shape
+
+    if out is None:
+        return np.empty(shape, dtype=np.float64)
+
+    if not isinstance(out, np.ndarray):
+        raise TypeError("out must be a numpy array.")
+
+    if out.dtype != np.float64 or not out.flags['C_CONTIGUOUS'] \
+            or not out.flags['WRITEABLE']:
+        raise ValueError("out must be a writeable, C-contiguous float64 array.")
+
+    if out.size != np.prod(shape):
+        raise ValueError("out has " + str(out.size) + " elements, but "
+                         + str(np.prod(shape)) + " are needed.")
+
+    return out.reshape(shape)
+
+def _ptr(a):
+    """ Pointer to the data of a float64 array, to pass to libexact. """
+    return a.ctypes.data_as(POINTER(c_double))
+
+def _get_iplot(plot, plots):
+    """ Return the libexact iplot value for the quantity named plot. """
+    pin = checkfmt(plot)
+    if pin not in plots:
+        print("PySplash Exact: Unrecognised plot type `" + plot + "`")
+        print("PySplash Exact: plot = " + " || ".join(plots))
+        exit(1)
+    return plots[pin]
+
+def _evaluate(module, call, x, plot, plots, time, out, copy_input=False):
+    """ Evaluate a libexact routine for one or several plot quantities and times.
+
+    call(iplot, time, x, y, ierr) wraps the libexact routine. If plot is a
+    list of names, a dict of arrays is returned, one per quantity. If time
+    is a 1D array, each result has shape (len(time),) + x.shape. All
+    evaluations happen within a single stdout redirection, and the results
+    are views into one array, which is out if it is given.
+    Use copy_input=True for routines that write into their input grid.
+    """
+    multiple = not isinstance(plot, str)
+    names = list(plot) if multiple else [plot]
+    iplots = [_get_iplot(name, plots) for name in names]
+
+    leading = (len(names),) if multiple else ()
+
+    if np.ndim(time) == 0:
+        times = [time]
+    elif np.ndim(time) == 1:
+        times = np.asarray(time, dtype=np.float64)
+        leading = leading + (len(times),)
+    else:
+        raise ValueError("time must be a scalar or a 1D array.")
+
+    x = _input_array(x)
+    y = _output_array(x, out, leading)
+    ys = y.reshape((len(names), len(times)) + x.shape)
+
+    ierr = c_int(0)
+
+    with stdchannel_redirected():
+        for iplot, y_plot in zip(iplots, ys):
+            for time_i, y_i in zip(times, y_plot):
+                x_i = _input_array(x, copy=True) if copy_input else x
+                call(iplot, float(time_i), x_i, y_i, ierr)
+                if ierr.value == 1:
+                    break
+            if ierr.value == 1:
+                break
+
+    check_error(ierr, module)
+
+    if multiple:
+        return dict(zip(names, y))
+    return y
+
+_shock_plots = {
+    'density': 1,
+    'pressure': 2,
+    'velocity': 3,
+    'uthermal': 4,
+    'deltav': 5,
+    'dustfrac': 6,
+}
+
+@cached
 def shock(
     x,
     plot         = 'density',
@@ -29,35 +134,13 @@ def shock(
     p_R          = 0.1,
     v_L          = 0,
     v_R          = 0.,
-    rdust_to_gas = 0.):
+    rdust_to_gas = 0.,
+    out          = None):
 
-    pin = checkfmt(plot)
-    if   (pin == 'density'):
-        iplot = 1
-    elif (pin == 'pressure'):
-        iplot = 2
-    elif (pin == 'velocity'):
-        iplot = 3
-    elif (pin == 'uthermal'):
-        iplot = 4
-    elif (pin == 'deltav'):
-        iplot = 5
-    elif (pin == 'dustfrac'):
-        iplot = 6
-    else:
-        print("PySplash Exact: Unrecognised plot type.")
-        print("PySplash Exact: plot = density || pressure || velocity || uthermal || deltav || dustfrac")
-        exit(1)
-
-    ierr = 0
-    c_x = (c_double*len(x))()
-    c_y = (c_double*len(x))()
-    c_x[:] = x[:]
-
-    with stdchannel_redirected():
+    def call(iplot, time, x, y, ierr):
         libexact._shock(
             byref(c_int(iplot)),
-            byref(c_int(len(x))),
+            byref(c_int(x.size)),
             byref(c_double(time)),
             byref(c_double(gamma)),
             byref(c_double(xshock)),
@@ -68,15 +151,22 @@ def shock(
             byref(c_double(v_L)),
             byref(c_double(v_R)),
             byref(c_double(rdust_to_gas)),
-            byref(c_x),
-            byref(c_y),
-            byref(c_int(ierr))
+            _ptr(x),
+            _ptr(y),
+            byref(ierr)
         )
 
-    check_error(ierr, "shock")
+    return _evaluate("shock", call, x, plot, _shock_plots, time, out)
 
-    return as_array(c_y)
+_shock_sr_plots = {
+    'density': 1,
+    'pressure': 2,
+    'velocity': 3,
+    'uthermal': 4,
+    'density*': 5,
+}
 
+@cached
 def shock_sr(
     x,
     plot    = 'density',
@@ -87,33 +177,13 @@ def shock_sr(
     p_L     = 1.0,
     p_R     = 0.1,
     v_L     = 0.,
-    v_R     = 0.):
-
-    pin = checkfmt(plot)
-    if   (pin == 'density'):
-        iplot = 1
-    elif (pin == 'pressure'):
-        iplot = 2
-    elif (pin == 'velocity'):
-        iplot = 3
-    elif (pin == 'uthermal'):
-        iplot = 4
-    elif (pin == 'density*'):
-        iplot = 5
-    else:
-        print("PySplash Exact: Unrecognised plot type.")
-        print("PySplash Exact: plot = density || pressure || velocity || uthermal || density*")
-        exit(1)
-
-    ierr = 0
-    c_x = (c_double*len(x))()
-    c_y = (c_double*len(x))()
-    c_x[:] = x[:]
+    v_R     = 0.,
+    out     = None):
 
-    with stdchannel_redirected():
+    def call(iplot, time, x, y, ierr):
         libexact._shock_sr(
             byref(c_int(iplot)),
-            byref(c_int(len(x))),
+            byref(c_int(x.size)),
             byref(c_double(time)),
             byref(c_double(gamma)),
             byref(c_double(rho_L)),
@@ -122,15 +192,22 @@ def shock_sr(
             byref(c_double(p_R)),
             byref(c_double(v_L)),
             byref(c_double(v_R)),
-            byref(c_x),
-            byref(c_y),
-            byref(c_int(ierr))
+            _ptr(x),
+            _ptr(y),
+            byref(ierr)
         )
 
-    check_error(ierr, "shock_sr")
+    return _evaluate("shock_sr", call, x, plot, _shock_sr_plots, time, out)
 
-    return as_array(c_y)
+_sedov_plots = {
+    'density': 1,
+    'pressure': 2,
+    'uthermal': 3,
+    'kinetic_energy': 4,
+    'velocity': 5,
+}
 
+@cached
 def sedov(
     r,
     plot    = 'density',
@@ -138,81 +215,68 @@ def sedov(
     gamma   = 5./3.,
     rhozero = 1.,
     energy  = 1.,
-    rmax    = 1.):
+    rmax    = 1.,
+    out     = None):
 
-    pin = checkfmt(plot)
-    if   (pin == 'density'):
-        iplot = 1
-    elif (pin == 'pressure'):
-        iplot = 2
-    elif (pin == 'uthermal'):
-        iplot = 3
-    elif (pin == 'kinetic_energy'):
-        iplot = 4
-    elif (pin == 'velocity'):
-        iplot = 5
-    else:
-        print("PySplash Exact: Unrecognised plot type.")
-        print("PySplash Exact: plot = density || pressure || uthermal || kinetic_energy ||  velocity ")
-        exit(1)
-
-    ierr = 0
-    c_r = (c_double*len(r))()
-    c_y = (c_double*len(r))()
-    c_r[:] = r[:]
-
-    with stdchannel_redirected():
+    def call(iplot, time, r, y, ierr):
         libexact._sedov(
             byref(c_int(iplot)),
-            byref(c_int(len(r))),
+            byref(c_int(r.size)),
             byref(c_double(time)),
             byref(c_double(gamma)),
             byref(c_double(rhozero)),
             byref(c_double(energy)),
             byref(c_double(rmax)),
-            byref(c_r),
-            byref(c_y),
-            byref(c_int(ierr))
+            _ptr(r),
+            _ptr(y),
+            byref(ierr)
         )
 
-    check_error(ierr, "sedov")
-
-    return as_array(c_y)
+    return _evaluate("sedov", call, r, plot, _sedov_plots, time, out)
 
+@cached
 def polytrope(
     r,
     gamma   = 5./3.,
     polyk   = 1.,
-    totmass = 1.):
-
-
-    ierr = 0
+    totmass = 1.,
+    out     = None):
 
-    c_r = (c_double*len(r))()
-    c_y = (c_double*len(r))()
 
-    c_r[:] = r[:]
+    # The polytrope solution overwrites the grid, so do not pass the caller's array
+    r = _input_array(r, copy=True)
+    y = _output_array(r, out)
+    ierr = c_int(0)
 
-    npartout = len(r)
-    nout = c_int(0)
+    c_nout = c_int(0)
 
     with stdchannel_redirected():
         libexact._polytrope(
-            byref(c_int(len(r))),
+            byref(c_int(r.size)),
             byref(c_double(gamma)),
             byref(c_double(polyk)),
             byref(c_double(totmass)),
-            byref(c_r),
-            byref(c_y),
+            _ptr(r),
+            _ptr(y),
             byref(c_nout),
-            byref(c_int(ierr))
+            byref(ierr)
         )
 
     check_error(ierr, "polytrope")
 
-    return as_array(c_y)
+    return y
 
 
+_toystar1d_plots = {
+    'density': 1,
+    'pressure': 2,
+    'uthermal': 3,
+    'velocity_x': 4,
+    'mag_field_y': 5,
+    'ac_plane': 7,
+}
+
+@cached
 def toystar1D(
     x,
     plot    = 'density',
@@ -222,36 +286,13 @@ def toystar1D(
     A0      = 1.,
     C0      = 1.,
     sigma   = 0.,
-    norder  = -1):
-
-    pin = checkfmt(plot)
-    if   (pin == 'density'):
-        iplot = 1
-    elif (pin == 'pressure'):
-        iplot = 2
-    elif (pin == 'uthermal'):
-        iplot = 3
-    elif (pin == 'velocity_x'):
-        iplot = 4
-    elif (pin == 'mag_field_y'):
-        iplot = 5
-    elif (pin == 'ac_plane'):
-        iplot = 7
-    else:
-        print("PySplash Exact: Unrecognised plot type.")
-        print("PySplash Exact: plot = density || pressure || uthermal || velocity_x ||  mag_field_y || ac_plane ")
-        exit(1)
+    norder  = -1,
+    out     = None):
 
-
-    ierr = 0
-    c_x = (c_double*len(x))()
-    c_y = (c_double*len(x))()
-    c_x[:] = x[:]
-
-    with stdchannel_redirected():
+    def call(iplot, time, x, y, ierr):
         libexact._toystar1d(
             byref(c_int(iplot)),
-            byref(c_int(len(x))),
+            byref(c_int(x.size)),
             byref(c_double(time)),
             byref(c_double(gamma)),
             byref(c_double(H0)),
@@ -259,16 +300,24 @@ def toystar1D(
             byref(c_double(C0)),
             byref(c_double(sigma)),
             byref(c_int(norder)),
-            byref(c_x),
-            byref(c_y),
-            byref(c_int(ierr))
+            _ptr(x),
+            _ptr(y),
+            byref(ierr)
         )
 
-    check_error(ierr, "toystar1D")
+    return _evaluate("toystar1D", call, x, plot, _toystar1d_plots, time, out)
 
-    return as_array(c_y)
 
+_toystar2d_plots = {
+    'density': 1,
+    'pressure': 2,
+    'uthermal': 3,
+    'velocity_x': 4,
+    'velocity_y': 5,
+    'x_vs_y': 0,
+}
 
+@cached
 def toystar2D(
     x,
     plot    = 'density',
@@ -284,36 +333,13 @@ def toystar2D(
     V11     = 0,
     V22     = 0,
     V12     = 0,
-    V21     = 0):
-
-    pin = checkfmt(plot)
-    if   (pin == 'density'):
-        iplot = 1
-    elif (pin == 'pressure'):
-        iplot = 2
-    elif (pin == 'uthermal'):
-        iplot = 3
-    elif (pin == 'velocity_x'):
-        iplot = 4
-    elif (pin == 'velocity_y'):
-        iplot = 5
-    elif (pin == 'x_vs_y'):
-        iplot = 0
-    else:
-        print("PySplash Exact: Unrecognised plot type.")
-        print("PySplash Exact: plot = density || pressure || uthermal || velocity_x ||  velocity_y || x_vs_y ")
-        exit(1)
-
+    V21     = 0,
+    out     = None):
 
-    ierr = 0
-    c_x = (c_double*len(x))()
-    c_y = (c_double*len(x))()
-    c_x[:] = x[:]
-
-    with stdchannel_redirected():
+    def call(iplot, time, x, y, ierr):
         libexact._toystar2d(
             byref(c_int(iplot)),
-            byref(c_int(len(x))),
+            byref(c_int(x.size)),
             byref(c_double(time)),
             byref(c_double(gamma)),
             byref(c_double(polyk)),
@@ -327,19 +353,19 @@ def toystar2D(
             byref(c_double(V22)),
             byref(c_double(V12)),
             byref(c_double(V21)),
-            byref(c_x),
-            byref(c_y),
-            byref(c_int(ierr))
+            _ptr(x),
+            _ptr(y),
+            byref(ierr)
         )
 
-    check_error(ierr, "toystar2D")
-
-    return as_array(c_y)
+    return _evaluate("toystar2D", call, x, plot, _toystar2d_plots, time, out)
 
 
+@cached
 def gresho(
     x,
-    plot = 'velocity_phi'):
+    plot = 'velocity_phi',
+    out  = None):
 
     pin = checkfmt(plot)
     if   (pin == 'velocity_phi'):
@@ -352,24 +378,36 @@ def gresho(
         exit(1)
 
 
-    ierr = 0
-    c_x = (c_double*len(x))()
-    c_y = (c_double*len(x))()
-    c_x[:] = x[:]
+    x = _input_array(x)
+    y = _output_array(x, out)
+    ierr = c_int(0)
 
     with stdchannel_redirected():
         libexact._gresho(
             byref(c_int(iplot)),
-            byref(c_int(len(x))),
-            byref(c_x),
-            byref(c_y),
-            byref(c_int(ierr))
+            byref(c_int(x.size)),
+            _ptr(x),
+            _ptr(y),
+            byref(ierr)
         )
 
     check_error(ierr, "gresho")
 
-    return as_array(c_y)
-
+    return y
+
+_mhdshock_plots = {
+    'density': 1,
+    'pressure': 2,
+    'velocity_x': 3,
+    'velocity_y': 4,
+    'velocity_z': 5,
+    'mag_field_y': 6,
+    'mag_field_z': 7,
+    'uthermal': 8,
+    'bxzero': 9,
+}
+
+@cached
 def mhdshock(
     x,
     plot     = 'density',
@@ -378,31 +416,8 @@ def mhdshock(
     gamma    = 5./3.,
     xmin     = -1,
     xmax     = 1,
-    xshock   = 0):
-
-    pin = checkfmt(plot)
-    if   (pin == 'density'):
-        iplot = 1
-    elif (pin == 'pressure'):
-        iplot = 2
-    elif (pin == 'velocity_x'):
-        iplot = 3
-    elif (pin == 'velocity_y'):
-        iplot = 4
-    elif (pin == 'velocity_z'):
-        iplot = 5
-    elif (pin == 'mag_field_y'):
-        iplot = 6
-    elif (pin == 'mag_field_z'):
-        iplot = 7
-    elif (pin == 'uthermal'):
-        iplot = 8
-    elif (pin == 'Bxzero'):
-        iplot = 9
-    else:
-        print("PySplash Exact: Unrecognised plot type.")
-        print("PySplash Exact: plot = density || pressure || velocity_x ||  velocity_y || velocity_z || mag_field_y || mag_field_z || uthermal || Bxzero ")
-        exit(1)
+    xshock   = 0,
+    out      = None):
 
     ishk = 0
     pin = checkfmt(solution)
@@ -426,39 +441,36 @@ def mhdshock(
         exit(1)
 
 
-    ierr = 0
-    c_x = (c_double*len(x))()
-    c_y = (c_double*len(x))()
-    c_x[:] = x[:]
     c_nout = c_int(0)
 
-    with stdchannel_redirected():
+    def call(iplot, time, x, y, ierr):
         libexact._mhdshock(
             byref(c_int(iplot)),
-            byref(c_int(len(x))),
+            byref(c_int(x.size)),
             byref(c_int(ishk)),
             byref(c_double(time)),
             byref(c_double(gamma)),
             byref(c_double(xmin)),
             byref(c_double(xmax)),
             byref(c_double(xshock)),
-            byref(c_x),
-            byref(c_y),
+            _ptr(x),
+            _ptr(y),
             byref(c_nout),
-            byref(c_int(ierr))
+            byref(ierr)
         )
 
-    check_error(ierr, "mhdshock")
-
-    return as_array(c_y)
+    # mhdshock returns its own grid in x, so do not pass the caller's array
+    return _evaluate("mhdshock", call, x, plot, _mhdshock_plots, time, out, copy_input=True)
 
 
+@cached
 def rhoh(
     x,
     plot        = 'density',
     ndim        = 3,
     hfact       = 1.2,
-    pmassval    = 1.0):
+    pmassval    = 1.0,
+    out         = None):
 
     pin = checkfmt(plot)
     if   (pin == 'h'):
@@ -471,34 +483,35 @@ def rhoh(
         exit(1)
 
 
-    ierr = 0
-    c_x = (c_double*len(x))()
-    c_y = (c_double*len(x))()
-    c_x[:] = x[:]
+    x = _input_array(x)
+    y = _output_array(x, out)
+    ierr = c_int(0)
 
     with stdchannel_redirected():
         libexact._rhoh(
             byref(c_int(iplot)),
-            byref(c_int(len(x))),
+            byref(c_int(x.size)),
             byref(c_int(ndim)),
             byref(c_double(hfact)),
             byref(c_double(pmassval)),
-            byref(c_x),
-            byref(c_y),
-            byref(c_int(ierr))
+            _ptr(x),
+            _ptr(y),
+            byref(ierr)
         )
 
     check_error(ierr, "rhoh")
 
-    return as_array(c_y)
+    return y
 
 
+@cached
 def densityprofiles(
     x,
     plot    = 'density',
     profile = 'Plummer',
     Msphere = [1.0,0.0],
-    rsoft   = [1.0,0.1]):
+    rsoft   = [1.0,0.1],
+    out     = None):
 
     pin = checkfmt(plot)
     if   (pin == 'density'):
@@ -523,30 +536,30 @@ def densityprofiles(
         exit(1)
 
 
-    ierr = 0
-    c_x = (c_double*len(x))()
-    c_y = (c_double*len(x))()
-    c_x[:] = x[:]
+    x = _input_array(x)
+    y = _output_array(x, out)
+    ierr = c_int(0)
 
     with stdchannel_redirected():
         libexact._densityprofiles(
             byref(c_int(iplot)),
-            byref(c_int(len(x))),
+            byref(c_int(x.size)),
             byref(c_int(iprofile)),
             byref(c_double(Msphere[0])),
             byref(c_double(Msphere[1])),
             byref(c_double(rsoft[0])),
             byref(c_double(rsoft[1])),
-            byref(c_x),
-            byref(c_y),
-            byref(c_int(ierr))
+            _ptr(x),
+            _ptr(y),
+            byref(ierr)
         )
 
     check_error(ierr, "densityprofiles")
 
-    return as_array(c_y)
+    return y
 
 
+@cached
 def torus(
     x,
     plot        = 'density',
@@ -555,7 +568,8 @@ def torus(
     Rtorus      = 1.0,
     polyk       = 0.0764,
     distortion  = 1.1,
-    gamma       = 5./3.):
+    gamma       = 5./3.,
+    out         = None):
 
     pin = checkfmt(plot)
     if   (pin == 'density'):
@@ -585,71 +599,68 @@ def torus(
         exit(1)
 
 
-    ierr = 0
-    c_x = (c_double*len(x))()
-    c_y = (c_double*len(x))()
-    c_x[:] = x[:]
+    x = _input_array(x)
+    y = _output_array(x, out)
+    ierr = c_int(0)
 
     with stdchannel_redirected():
         libexact._torus_(
             byref(c_int(iplot)),
-            byref(c_int(len(x))),
+            byref(c_int(x.size)),
             byref(c_int(itorus)),
             byref(c_double(Mstar)),
             byref(c_double(Rtorus)),
             byref(c_double(polyk)),
             byref(c_double(distortion)),
             byref(c_double(gamma)),
-            byref(c_x),
-            byref(c_y),
-            byref(c_int(ierr))
+            _ptr(x),
+            _ptr(y),
+            byref(ierr)
         )
 
     check_error(ierr, "torus")
 
-    return as_array(c_y)
+    return y
+
 
+_ringspread_plots = {
+    'density': 1,
+}
 
+@cached
 def ringspread(
     x,
     plot   = 'density',
     time   = 1.0,
     Mdisk  = 1.0,
     Rdisk  = 1.0,
-    viscnu = 1.e-3):
-
-    pin = checkfmt(plot)
-    if   (pin == 'density'):
-        iplot = 1
-    else:
-        print("PySplash Exact: Unrecognised plot type.")
-        print("PySplash Exact: plot = density")
-        exit(1)
-
+    viscnu = 1.e-3,
+    out    = None):
 
-    ierr = 0
-    c_x = (c_double*len(x))()
-    c_y = (c_double*len(x))()
-    c_x[:] = x[:]
-
-    with stdchannel_redirected():
+    def call(iplot, time, x, y, ierr):
         libexact._ringspread(
             byref(c_int(iplot)),
-            byref(c_int(len(x))),
+            byref(c_int(x.size)),
             byref(c_double(time)),
             byref(c_double(Mdisk)),
             byref(c_double(Rdisk)),
             byref(c_double(viscnu)),
-            byref(c_x),
-            byref(c_y),
-            byref(c_int(ierr))
+            _ptr(x),
+            _ptr(y),
+            byref(ierr)
         )
 
-    check_error(ierr, "ringspread")
+    return _evaluate("ringspread", call, x, plot, _ringspread_plots, time, out)
 
-    return as_array(c_y)
 
+_dustywave_plots = {
+    'gas_velocity': 1,
+    'dust_velocity': 2,
+    'gas_density': 3,
+    'dust_density': 4,
+}
 
+@cached
 def dustywave(
     x,
     plot       = 'gas_density',
@@ -660,32 +671,13 @@ def dustywave(
     lambdacoef = 1.0,
     x0         = 1.0,
     rhog0      = 1.0,
-    rhod0      = 1.0):
-
-    pin = checkfmt(plot)
-    if   (pin == 'gas_velocity'):
-        iplot = 1
-    elif (pin == 'dust_velocity'):
-        iplot = 2
-    elif (pin == 'gas_density'):
-        iplot = 3
-    elif (pin == 'dust_density'):
-        iplot = 4
-    else:
-        print("PySplash Exact: Unrecognised plot type `" + plot + "`")
-        print("PySplash Exact: plot = gas_velocity || dust_velocity || gas_density || dust_density")
-        exit(1)
+    rhod0      = 1.0,
+    out        = None):
 
-
-    ierr = 0
-    c_x = (c_double*len(x))()
-    c_y = (c_double*len(x))()
-    c_x[:] = x[:]
-
-    with stdchannel_redirected():
+    def call(iplot, time, x, y, ierr):
         libexact._dustywave(
             byref(c_int(iplot)),
-            byref(c_int(len(x))),
+            byref(c_int(x.size)),
             byref(c_double(time)),
             byref(c_double(ampl)),
             byref(c_double(cs)),
@@ -694,48 +686,56 @@ def dustywave(
             byref(c_double(x0)),
             byref(c_double(rhog0)),
             byref(c_double(rhod0)),
-            byref(c_x),
-            byref(c_y),
-            byref(c_int(ierr))
+            _ptr(x),
+            _ptr(y),
+            byref(ierr)
         )
 
-    check_error(ierr, "dustywave")
-
-    return as_array(c_y)
+    return _evaluate("dustywave", call, x, plot, _dustywave_plots, time, out)
 
 
+@cached
 def rochelobe(
     x,
     primatypos = [0.,0.],
     secondarypos = [1.,0.],
     primarymass =  1.,
-    secondarymass = 1.):
+    secondarymass = 1.,
+    out           = None):
 
 
-    ierr = 0
-    c_x = (c_double*len(x))()
-    c_y = (c_double*len(x))()
-    c_x[:] = x[:]
+    x = _input_array(x)
+    y = _output_array(x, out)
+    ierr = c_int(0)
 
     with stdchannel_redirected():
         libexact._rochelobe(
-            byref(c_int(len(x))),
+            byref(c_int(x.size)),
             byref(c_double(primatypos[0])),
             byref(c_double(primatypos[1])),
             byref(c_double(secondarypos[0])),
             byref(c_double(secondarypos[0])),
             byref(c_double(primarymass)),
             byref(c_double(secondarymass)),
-            byref(c_x),
-            byref(c_y),
-            byref(c_int(ierr))
+            _ptr(x),
+            _ptr(y),
+            byref(ierr)
         )
 
     check_error(ierr, "rochelobe")
 
-    return as_array(c_y)
+    return y
+
 
+_cshock_plots = {
+    'density': 1,
+    'mag_field_y': 2,
+    'velocity_x': 3,
+    'velocity_y': 4,
+    'mag_field_x': 5,
+}
 
+@cached
 def cshock(
     x,
     plot='density',
@@ -744,48 +744,25 @@ def cshock(
     machs = 50.,
     macha = 5.,
     xmin=-0.25,
-    xmax= 0.25,):
+    xmax= 0.25,
+    out=None):
 
-    pin = checkfmt(plot)
-    if   (pin == 'density'):
-        iplot = 1
-    elif (pin == 'mag_field_y'):
-        iplot = 2
-    elif (pin == 'velocity_x'):
-        iplot = 3
-    elif (pin == 'velocity_y'):
-        iplot = 4
-    elif (pin == 'mag_field_x'):
-        iplot = 5
-    else:
-        print("PySplash Exact: Unrecognised plot type `" + plot + "`")
-        print("PySplash Exact: plot = density || mag_field_x || mag_field_y || velocity_x || velocity_y")
-        exit(1)
-
-
-    ierr = 0
-    c_x = (c_double*len(x))()
-    c_y = (c_double*len(x))()
-    c_x[:] = x[:]
-
-    with stdchannel_redirected():
+    def call(iplot, time, x, y, ierr):
         libexact._cshock(
             byref(c_int(iplot)),
-            byref(c_int(len(x))),
+            byref(c_int(x.size)),
             byref(c_double(time)),
             byref(c_double(gamma)),
             byref(c_double(machs)),
             byref(c_double(macha)),
             byref(c_double(xmin)),
             byref(c_double(xmax)),
-            byref(c_x),
-            byref(c_y),
-            byref(c_int(ierr))
+            _ptr(x),
+            _ptr(y),
+            byref(ierr)
         )
 
-    check_error(ierr, "cshock")
-
-    return as_array(c_y)
+    return _evaluate("cshock", call, x, plot, _cshock_plots, time, out)
 
 
 def check_spiral_params(i1, i2, j1, j2, nparams, nsolutions):
@@ -802,6 +779,12 @@ def check_spiral_params(i1, i2, j1, j2, nparams, nsolutions):
         print("PySplash Exact: Wrong Spiral Params. i1 > "+str(nsolutions)+". Should define blocks [i1,i2,j1,j2,val].")
         exit(1)
 
+_planetdisc_plots = {
+    'phi_r_plane': 1,
+    'x_y_plane': 2,
+}
+
+@cached
 def planetdisc(
     x,
     plot='phi/r plane',
@@ -811,19 +794,11 @@ def planetdisc(
     rplanet = 1.,
     q_index = 0.25,
     narms = 1,
-    spiral_params=[[1,1,0,6,360]]):
+    spiral_params=[[1,1,0,6,360]],
+    out=None):
     # same as filling block i1 to i2, j1 to j2 with x
     # spiral_params = 0.
     # spiral_params(2,:) = 360.
-    pin = checkfmt(plot)
-    if   (pin == 'phi_r_plane'):
-        iplot = 1
-    elif (pin == 'x_y_plane'):
-        iplot = 2
-    else:
-        print("PySplash Exact: Unrecognised plot type `" + plot + "`")
-        print("PySplash Exact: plot = phi-r plane || x-y plane")
-        exit(1)
 
     ispiral = 0
     pin = checkfmt(spiral)
@@ -837,10 +812,6 @@ def planetdisc(
         exit(1)
 
 
-    ierr = 0
-    c_x = (c_double*len(x))()
-    c_y = (c_double*len(x))()
-    c_x[:] = x[:]
     nparams = 7
     nsolutions = 10
     c_params = (c_double*nparams*nsolutions)()
@@ -855,10 +826,10 @@ def planetdisc(
             for j in range(j1,j2+1):
                 c_params[i][j] = val
 
-    with stdchannel_redirected():
+    def call(iplot, time, x, y, ierr):
         libexact._planetdisc(
             byref(c_int(iplot)),
-            byref(c_int(len(x))),
+            byref(c_int(x.size)),
             byref(c_int(ispiral)),
             byref(c_double(time)),
             byref(c_double(HonR)),
@@ -866,16 +837,21 @@ def planetdisc(
             byref(c_double(q_index)),
             byref(c_int(narms)),
             byref(c_params),
-            byref(c_x),
-            byref(c_y),
-            byref(c_int(ierr))
+            _ptr(x),
+            _ptr(y),
+            byref(ierr)
         )
 
-    check_error(ierr, "planetdisc")
+    return _evaluate("planetdisc", call, x, plot, _planetdisc_plots, time, out)
 
-    return as_array(c_y)
 
+_bondi_plots = {
+    'velocity_x': 1,
+    'uthermal': 2,
+    'density': 2,
+}
 
+@cached
 def bondi(
     x,
     plot = 'density',
@@ -886,30 +862,13 @@ def bondi(
     Mstar = 1,
     relativistic  = True,
     geodesic_flow = False,
-    is_wind       = True):
-
-    pin = checkfmt(plot)
-    if   (pin == 'velocity_x'):
-        iplot = 1
-    elif (pin == 'uthermal'):
-        iplot = 2
-    elif (pin == 'density'):
-        iplot = 2
-    else:
-        print("PySplash Exact: Unrecognised plot type `" + plot + "`")
-        print("PySplash Exact: plot = velocity_x || uthermal || density")
-        exit(1)
-
-
-    ierr = 0
-    c_x = (c_double*len(x))()
-    c_y = (c_double*len(x))()
-    c_x[:] = x[:]
+    is_wind       = True,
+    out           = None):
 
-    with stdchannel_redirected():
+    def call(iplot, time, x, y, ierr):
         libexact._bondi(
             byref(c_int(iplot)),
-            byref(c_int(len(x))),
+            byref(c_int(x.size)),
             byref(c_double(time)),
             byref(c_double(gamma)),
             byref(c_double(const1)),
@@ -918,11 +877,9 @@ def bondi(
             byref(c_bool(relativistic)),
             byref(c_bool(geodesic_flow)),
             byref(c_bool(is_wind)),
-            byref(c_x),
-            byref(c_y),
-            byref(c_int(ierr))
+            _ptr(x),
+            _ptr(y),
+            byref(ierr)
         )
 
-    check_error(ierr, "bondi")
-
-    return as_array(c_y)
+    return _evaluate("bondi", call, x, plot, _bondi_plots, time, out)
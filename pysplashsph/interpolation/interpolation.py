@@ -1,27 +1,1289 @@
-import os.path
-from pathlib import Path
+import functools
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 
-from ctypes import c_int, c_float, c_bool, byref
-from . import libinterpolation
+import numpy as np
 
+from .kernels import get_kernel
 
-def interpolate3d_projection():
-    pass
 
-def interpolate3d_proj_vec():
-    pass
+# Maximum number of particle-pixel pairs evaluated at once. This bounds the
+# memory used by the temporary arrays of each batch.
+_batch_size = 2**22
 
-def interpolate3d_fastxsec():
-    pass
+# Default size in pixels of the square tiles rendered in parallel
+_tilesize = 128
 
-def interpolate3d_xsec_vec():
-    pass
 
-def interp3d_proj_opacity():
-    pass
+def _kernel_pairs(x, y, hh, xmin, ymin, pixwidthx, pixwidthy, npixx, npixy,
+                  table, q2offset=None):
+    """ Generate the pixels covered by each particle, and the kernel there.
 
-def interpolate3D_proj_geom():
-    pass
+    Yields batches of (pixel, particle, wab), where pixel is the flattened
+    index of a pixel in an image of shape (npixy, npixx), particle is the
+    index of a particle covering it and wab is table(q^2), with q the
+    distance from the pixel centre to the particle in units of its
+    smoothing length. table is a KernelTable. q2offset is added to q^2 of each particle, e.g.
+    (dz/h)^2 for the distance to a cross section.
 
-def interpolate3D_xsec_geom():
-    pass
+    Particles are grouped by the size of their footprint in pixels, and
+    each group is processed in batches of at most _batch_size
+    particle-pixel pairs, so the work is done by whole-array numpy
+    operations rather than a loop over particles.
+    """
+
+    # Footprint of each particle, in pixels either side of its own pixel
+    radius = _footprint(hh, table.radkern, q2offset)
+    ipixc = np.floor((x - xmin) / pixwidthx).astype(np.intp)
+    jpixc = np.floor((y - ymin) / pixwidthy).astype(np.intp)
+    nrx = np.ceil(radius / pixwidthx).astype(np.intp)
+    nry = np.ceil(radius / pixwidthy).astype(np.intp)
+
+    # Skip particles whose footprint does not touch the image
+    inside = (hh > 0.) & (ipixc + nrx >= 0) & (ipixc - nrx < npixx) \
+        & (jpixc + nry >= 0) & (jpixc - nry < npixy)
+    particles = np.flatnonzero(inside)
+
+    if len(particles) == 0:
+        return
+
+    # Group particles by footprint size. Within a group, sort them by
+    # pixel so that each batch covers a compact part of the image.
+    group = nrx[particles] * (nry[particles].max() + 1) + nry[particles]
+    cell = np.clip(jpixc[particles], 0, npixy - 1) * npixx \
+        + np.clip(ipixc[particles], 0, npixx - 1)
+    particles = particles[np.lexsort((cell, group))]
+    group = nrx[particles] * (nry[particles].max() + 1) + nry[particles]
+    starts = np.flatnonzero(np.diff(group, prepend=-1))
+    ends = np.append(starts[1:], len(particles))
+
+    for start, end in zip(starts, ends):
+        rx = nrx[particles[start]]
+        ry = nry[particles[start]]
+        offsetx = np.arange(-rx, rx + 1)
+        offsety = np.arange(-ry, ry + 1)
+
+        batch = max(1, _batch_size // (len(offsetx) * len(offsety)))
+
+        for first in range(start, end, batch):
+            p = particles[first:min(first + batch, end)]
+            hi1 = 1. / hh[p]
+
+            ipix = ipixc[p][:, None] + offsetx[None, :]
+            jpix = jpixc[p][:, None] + offsety[None, :]
+
+            dx2 = ((xmin + (ipix + 0.5) * pixwidthx - x[p][:, None]) * hi1[:, None])**2
+            dy2 = ((ymin + (jpix + 0.5) * pixwidthy - y[p][:, None]) * hi1[:, None])**2
+            q2 = dy2[:, :, None] + dx2[:, None, :]
+            if q2offset is not None:
+                q2 += q2offset[p][:, None, None]
+
+            valid = (q2 < table.radkern2) \
+                & ((ipix >= 0) & (ipix < npixx))[:, None, :] \
+                & ((jpix >= 0) & (jpix < npixy))[:, :, None]
+
+            pixel = (jpix[:, :, None] * npixx + ipix[:, None, :])[valid]
+
+            if len(pixel) == 0:
+                continue
+
+            particle = np.broadcast_to(p[:, None, None], q2.shape)[valid]
+
+            yield pixel, particle, table(q2[valid])
+
+
+def _footprint(hh, radkern, q2offset=None):
+    """ Radius of each kernel, in the plane where q^2 has q2offset added. """
+    if q2offset is None:
+        return radkern * hh
+    return hh * np.sqrt(np.maximum(radkern**2 - q2offset, 0.))
+
+
+def _interpolate2d(x, y, hh, weights, xmin, ymin, pixwidthx, pixwidthy,
+                   npixx, npixy, table, q2offset=None):
+    """ Deposit particles onto a pixel grid with a tabulated kernel.
+
+    Every row of weights is deposited in the same pass over the particles,
+    i.e. pixel (i, j) of output k is the sum over particles of
+    weights[k] * table(q^2), with the pairs of pixels and particles from
+    _kernel_pairs.
+
+    Returns an array of shape (len(weights), npixy, npixx).
+    """
+
+    nweights = len(weights)
+    datsmooth = np.zeros((nweights, npixy * npixx))
+
+    for pixel, particle, wab in _kernel_pairs(x, y, hh, xmin, ymin,
+                                              pixwidthx, pixwidthy,
+                                              npixx, npixy, table, q2offset):
+
+        # Accumulate over the range of pixels touched by this batch only
+        pixmin = pixel.min()
+        pixel -= pixmin
+        npixel = pixel.max() + 1
+
+        for k in range(nweights):
+            datsmooth[k, pixmin:pixmin + npixel] += \
+                np.bincount(pixel, weights=wab * weights[k][particle],
+                            minlength=npixel)
+
+    return datsmooth.reshape(nweights, npixy, npixx)
+
+
+def _get_quantity(dump, quantity):
+    """ Return quantity as an array, looking it up in dump if it is a name. """
+    if not isinstance(quantity, str):
+        return np.asarray(quantity, dtype=np.float64)
+
+    return dump[quantity]
+
+
+def _get_quantities(dump, quantity, shape):
+    """Return the names and values of the quantities to render.
+
+    quantity is one quantity as for _get_quantity, or a list of them. The
+    names are None for a single quantity, otherwise the label of each
+    quantity, or its position in the list if it was given as an array.
+    """
+    if isinstance(quantity, (list, tuple)) \
+            and all(isinstance(q, str) or np.ndim(q) > 0 for q in quantity):
+        names = [q if isinstance(q, str) else i for i, q in enumerate(quantity)]
+        quantities = quantity
+    else:
+        names = None
+        quantities = [quantity]
+
+    return names, [np.broadcast_to(_get_quantity(dump, q), shape) for q in quantities]
+
+
+def _results(datsmooth, names, normalise):
+    """Turn the rendered rows into the result of a renderer.
+
+    datsmooth has one row per quantity, followed by the interpolated
+    weight if normalise is True. Returns a single image, or a dict of
+    images if names is not None.
+    """
+    if normalise:
+        images = [_normalise(row, datsmooth[-1]) for row in datsmooth[:-1]]
+    else:
+        images = list(datsmooth)
+
+    if names is None:
+        return images[0]
+    return dict(zip(names, images))
+
+
+def _get_weight(dump, weight):
+    """ Return the interpolation weight m/(rho h^3) of each particle. """
+    if weight is not None:
+        return weight
+
+    # With rho = m (hfact/h)^3 the weight is the same for every particle
+    hfact = dump.headers.get('hfact', 1.2) if dump.headers else 1.2
+    return 1. / hfact**3
+
+
+def _get_limits(position, hh, lim, radkern):
+    """ Return lim, or the extent of the particles including their kernels. """
+    if lim is not None:
+        return float(lim[0]), float(lim[1])
+    return float((position - radkern * hh).min()), float((position + radkern * hh).max())
+
+
+def _cull(dump, limits, kernel, margin=0.):
+    """Indices of the particles whose kernel overlaps limits, or None.
+
+    limits is a dict of {label: (min, max)}, and margin widens every limit.
+    The tree of dump is used only if it has already been built or loaded,
+    since for a single render building it costs more than it saves. None
+    means every particle has to be used.
+    """
+    if not getattr(dump, 'has_tree', False) or len(limits) == 0:
+        return None
+
+    tree = dump.tree
+    if tree.labels is None or not set(limits) <= set(tree.labels):
+        return None
+
+    # The tree cannot find particles whose kernel reaches further than
+    # the kernel it was built with
+    if kernel.radkern > tree.radkern:
+        return None
+
+    lo = np.full(len(tree.labels), -np.inf)
+    hi = np.full(len(tree.labels), np.inf)
+    for label, lim in limits.items():
+        axis = tree.labels.index(label)
+        lo[axis] = lim[0] - margin
+        hi[axis] = lim[1] + margin
+
+    return tree.box(lo, hi)
+
+
+def _subset(select, *arrays):
+    """ Select particles from arrays, passing scalars through unchanged. """
+    if select is None:
+        return arrays
+    return tuple(a[select] if np.ndim(a) > 0 else a for a in arrays)
+
+
+def _get_pixels(xlim, ylim, npixx, npixy):
+    """ Return npixy and the pixel widths, keeping pixels square by default. """
+    pixwidthx = (xlim[1] - xlim[0]) / npixx
+
+    if npixy is None:
+        npixy = max(1, int(round((ylim[1] - ylim[0]) / pixwidthx)))
+
+    pixwidthy = (ylim[1] - ylim[0]) / npixy
+
+    return npixy, pixwidthx, pixwidthy
+
+
+def interpolate3d_projection(dump, quantity='density', x='x', y='y',
+                             npixx=512, npixy=None, xlim=None, ylim=None,
+                             weight=None, normalise=False, kernel='cubic'):
+    """Render the column integral of a quantity onto a pixel grid.
+
+    Parameters
+    ----------
+    dump
+        A Dump object.
+    quantity
+        The label of the quantity to render, or an array with one value per
+        particle. Rendering 'density' gives the column density. A list of
+        quantities is rendered in a single pass over the particles, and
+        returned as a dict keyed by label, or by position in the list for
+        arrays.
+    x, y
+        Labels of the coordinates used for the image axes. The quantity is
+        integrated along the remaining axis.
+    npixx, npixy
+        Number of pixels. By default npixy gives square pixels.
+    xlim, ylim
+        The extent of the image. Defaults to the extent of the particles.
+    weight
+        The interpolation weight m/(rho h^3), as a scalar or one value per
+        particle. Defaults to 1/hfact^3, which holds when the density is
+        set by the smoothing length as in Phantom.
+    normalise
+        If True, divide by the interpolated weight, giving a
+        density-weighted average along the line of sight rather than a
+        column integral.
+    kernel
+        The smoothing kernel, the name of one in kernels.kernels or a
+        Kernel. Defaults to the cubic spline.
+
+    Returns
+    -------
+    ndarray or dict
+        The image, with shape (npixy, npixx) so that rows follow y, or a
+        dict of images for a list of quantities.
+    """
+
+    kernel = get_kernel(kernel)
+
+    xpos = dump[x]
+    ypos = dump[y]
+    hh = dump['h']
+
+    names, dats = _get_quantities(dump, quantity, hh.shape)
+    weight = _get_weight(dump, weight)
+
+    limits = {label: lim for label, lim in [(x, xlim), (y, ylim)] if lim is not None}
+
+    xlim = _get_limits(xpos, hh, xlim, kernel.radkern)
+    ylim = _get_limits(ypos, hh, ylim, kernel.radkern)
+    npixy, pixwidthx, pixwidthy = _get_pixels(xlim, ylim, npixx, npixy)
+
+    # Particles smaller than a pixel would fall between pixel centres, so
+    # they are smoothed over half a pixel instead. Their weight is scaled
+    # so the integral over the image is unchanged.
+    hmin = 0.5 * max(pixwidthx, pixwidthy)
+
+    select = _cull(dump, limits, kernel, margin=kernel.radkern * hmin)
+    xpos, ypos, hh, weight, *dats = _subset(select, xpos, ypos, hh, weight, *dats)
+
+    # Particles with h <= 0 have been accreted, and are not rendered
+    xpos, ypos, hh, weight, *dats = _subset(hh > 0., xpos, ypos, hh, weight, *dats)
+
+    hsmooth = np.maximum(hh, hmin)
+
+    termnorm = weight * hh**3 / hsmooth**2
+
+    # Every quantity is deposited in the same pass over the particles
+    weights = np.array([termnorm * dat for dat in dats]
+                       + ([termnorm] if normalise else []))
+
+    datsmooth = _interpolate2d(xpos, ypos, hsmooth, weights,
+                               xlim[0], ylim[0], pixwidthx, pixwidthy,
+                               npixx, npixy, kernel.column)
+
+    return _results(datsmooth, names, normalise)
+
+
+def _normalise(datsmooth, datnorm):
+    """ Divide datsmooth by datnorm where datnorm is non-zero. """
+    return np.divide(datsmooth, datnorm, out=np.zeros_like(datsmooth),
+                     where=datnorm > 0.)
+
+
+def _interpolate2d_tiled(x, y, hh, weights, xmin, ymin, pixwidthx, pixwidthy,
+                         npixx, npixy, table, q2offset=None, tilesize=_tilesize,
+                         workers=None):
+    """ As _interpolate2d, but rendering square tiles of the image in threads.
+
+    Each tile is given the particles whose footprint overlaps it, so the
+    tiles are independent and are written to separate parts of the output.
+    numpy releases the GIL in the array operations of _interpolate2d, so
+    the tiles are rendered in parallel.
+    """
+
+    nweights = len(weights)
+    datsmooth = np.zeros((nweights, npixy, npixx))
+
+    radius = _footprint(hh, table.radkern, q2offset)
+
+    # Range of pixels covered by each particle
+    ipixmin = np.floor((x - radius - xmin) / pixwidthx).astype(np.intp)
+    ipixmax = np.floor((x + radius - xmin) / pixwidthx).astype(np.intp)
+    jpixmin = np.floor((y - radius - ymin) / pixwidthy).astype(np.intp)
+    jpixmax = np.floor((y + radius - ymin) / pixwidthy).astype(np.intp)
+
+    tiles = [(i0, j0) for j0 in range(0, npixy, tilesize)
+             for i0 in range(0, npixx, tilesize)]
+
+    def render(tile):
+        i0, j0 = tile
+        i1 = min(i0 + tilesize, npixx)
+        j1 = min(j0 + tilesize, npixy)
+
+        p = np.flatnonzero((ipixmax >= i0) & (ipixmin < i1)
+                           & (jpixmax >= j0) & (jpixmin < j1))
+
+        if len(p) == 0:
+            return
+
+        datsmooth[:, j0:j1, i0:i1] = _interpolate2d(
+            x[p], y[p], hh[p], weights[:, p],
+            xmin + i0 * pixwidthx, ymin + j0 * pixwidthy, pixwidthx, pixwidthy,
+            i1 - i0, j1 - j0, table,
+            q2offset=None if q2offset is None else q2offset[p])
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers == 1 or len(tiles) == 1:
+        for tile in tiles:
+            render(tile)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # list() so that exceptions from the threads are raised here
+            list(executor.map(render, tiles))
+
+    return datsmooth
+
+
+def _get_vector(dump, vector, x, y):
+    """ Return the two components of vector along the image axes x and y.
+
+    vector is either a pair of labels or arrays, or the prefix of the
+    labels, e.g. 'v' for ('vx', 'vy') or 'B' for ('Bx', 'By'). A prefix
+    also matches the labels SPLASH uses, e.g. ('v_x', 'v_y').
+    """
+    if isinstance(vector, str):
+        vector = [vector + '_' + axis if vector + '_' + axis in dump.labels
+                  else vector + axis for axis in (x, y)]
+
+    if len(vector) != 2:
+        raise ValueError("vector must have two components.")
+
+    return [_get_quantity(dump, component) for component in vector]
+
+
+def interpolate3d_proj_vec(dump, vector='v', x='x', y='y', npixx=512,
+                           npixy=None, xlim=None, ylim=None, weight=None,
+                           normalise=True, kernel='cubic'):
+    """Render the projection of a vector field onto a pixel grid.
+
+    Both components and the normalisation are accumulated in the same
+    pass over the particles.
+
+    Parameters
+    ----------
+    dump
+        A Dump object.
+    vector
+        The prefix of the labels of the vector, e.g. 'v' for the velocity
+        or 'B' for the magnetic field, or a pair of labels or arrays.
+    x, y
+        Labels of the coordinates used for the image axes. With a prefix,
+        the components along these axes are rendered.
+    npixx, npixy
+        Number of pixels. By default npixy gives square pixels.
+    xlim, ylim
+        The extent of the image. Defaults to the extent of the particles.
+    weight
+        The interpolation weight m/(rho h^3), as a scalar or one value per
+        particle. Defaults to 1/hfact^3.
+    normalise
+        If True, divide by the interpolated weight, giving the
+        density-weighted average of the vector along the line of sight.
+    kernel
+        The smoothing kernel, the name of one in kernels.kernels or a
+        Kernel. Defaults to the cubic spline.
+
+    Returns
+    -------
+    ndarray
+        The images of both components, with shape (2, npixy, npixx).
+    """
+
+    kernel = get_kernel(kernel)
+
+    xpos = dump[x]
+    ypos = dump[y]
+    hh = dump['h']
+
+    vecx, vecy = _get_vector(dump, vector, x, y)
+    weight = _get_weight(dump, weight)
+
+    limits = {label: lim for label, lim in [(x, xlim), (y, ylim)] if lim is not None}
+
+    xlim = _get_limits(xpos, hh, xlim, kernel.radkern)
+    ylim = _get_limits(ypos, hh, ylim, kernel.radkern)
+    npixy, pixwidthx, pixwidthy = _get_pixels(xlim, ylim, npixx, npixy)
+
+    hmin = 0.5 * max(pixwidthx, pixwidthy)
+
+    select = _cull(dump, limits, kernel, margin=kernel.radkern * hmin)
+    xpos, ypos, hh, vecx, vecy, weight = _subset(select, xpos, ypos, hh, vecx, vecy, weight)
+
+    # Particles with h <= 0 have been accreted, and are not rendered
+    xpos, ypos, hh, vecx, vecy, weight = _subset(hh > 0., xpos, ypos, hh, vecx, vecy, weight)
+
+    hsmooth = np.maximum(hh, hmin)
+
+    termnorm = weight * hh**3 / hsmooth**2
+    weights = np.array([termnorm * vecx, termnorm * vecy, termnorm])
+
+    datsmooth = _interpolate2d(xpos, ypos, hsmooth, weights,
+                               xlim[0], ylim[0], pixwidthx, pixwidthy,
+                               npixx, npixy, kernel.column)
+
+    if normalise:
+        return np.array([_normalise(datsmooth[0], datsmooth[2]),
+                         _normalise(datsmooth[1], datsmooth[2])])
+
+    return datsmooth[:2]
+
+
+def interpolate3d_fastxsec(dump, quantity='density', x='x', y='y', z='z',
+                           zslice=0., npixx=512, npixy=None, xlim=None,
+                           ylim=None, weight=None, normalise=False,
+                           tilesize=_tilesize, workers=None, kernel='cubic'):
+    """Render a quantity in a cross section through the particles.
+
+    The image is split into square tiles, which are rendered in parallel
+    in a pool of threads.
+
+    Parameters
+    ----------
+    dump
+        A Dump object.
+    quantity
+        The label of the quantity to render, or an array with one value per
+        particle. A list of quantities is rendered in a single pass over
+        the particles, and returned as a dict keyed by label, or by
+        position in the list for arrays.
+    x, y, z
+        Labels of the coordinates. The cross section is the plane z=zslice,
+        with image axes x and y.
+    zslice
+        Position of the cross section along z.
+    npixx, npixy
+        Number of pixels. By default npixy gives square pixels.
+    xlim, ylim
+        The extent of the image. Defaults to the extent of the particles.
+    weight
+        The interpolation weight m/(rho h^3), as a scalar or one value per
+        particle. Defaults to 1/hfact^3.
+    normalise
+        If True, divide by the interpolated weight.
+    tilesize
+        Size in pixels of the tiles.
+    workers
+        Number of threads. Defaults to the number of CPUs.
+    kernel
+        The smoothing kernel, the name of one in kernels.kernels or a
+        Kernel. Defaults to the cubic spline.
+
+    Returns
+    -------
+    ndarray or dict
+        The image, with shape (npixy, npixx) so that rows follow y, or a
+        dict of images for a list of quantities.
+    """
+
+    kernel = get_kernel(kernel)
+
+    hh = dump['h']
+    xpos = dump[x]
+    ypos = dump[y]
+    zpos = dump[z]
+
+    names, dats = _get_quantities(dump, quantity, hh.shape)
+    weight = np.broadcast_to(_get_weight(dump, weight), hh.shape)
+
+    limits = {label: lim for label, lim in [(x, xlim), (y, ylim), (z, (zslice, zslice))]
+              if lim is not None}
+    select = _cull(dump, limits, kernel)
+    xpos, ypos, zpos, hh, weight, *dats = _subset(select, xpos, ypos, zpos, hh,
+                                                  weight, *dats)
+
+    # Only particles whose kernel reaches the cross section contribute
+    q2offset = np.zeros_like(hh)
+    np.divide((zpos - zslice)**2, hh**2, out=q2offset, where=hh > 0.)
+    near = (hh > 0.) & (q2offset < kernel.radkern2)
+
+    xlim = _get_limits(xpos[near], hh[near], xlim, kernel.radkern)
+    ylim = _get_limits(ypos[near], hh[near], ylim, kernel.radkern)
+    npixy, pixwidthx, pixwidthy = _get_pixels(xlim, ylim, npixx, npixy)
+
+    weight = weight[near]
+    weights = np.array([weight * dat[near] for dat in dats]
+                       + ([weight] if normalise else []))
+
+    datsmooth = _interpolate2d_tiled(xpos[near], ypos[near], hh[near], weights,
+                                     xlim[0], ylim[0], pixwidthx, pixwidthy,
+                                     npixx, npixy, kernel.w,
+                                     q2offset=q2offset[near],
+                                     tilesize=tilesize, workers=workers)
+
+    return _results(datsmooth, names, normalise)
+
+
+def interpolate3d_xsec_vec(dump, vector='v', x='x', y='y', z='z', zslice=0.,
+                           npixx=512, npixy=None, xlim=None, ylim=None,
+                           weight=None, normalise=True, tilesize=_tilesize,
+                           workers=None, kernel='cubic'):
+    """Render a vector field in a cross section through the particles.
+
+    Both components and the normalisation are accumulated in the same
+    pass over the particles, and the tiles of the image are rendered in
+    parallel as in interpolate3d_fastxsec.
+
+    Parameters
+    ----------
+    dump
+        A Dump object.
+    vector
+        The prefix of the labels of the vector, e.g. 'v' for the velocity
+        or 'B' for the magnetic field, or a pair of labels or arrays.
+    x, y, z
+        Labels of the coordinates. The cross section is the plane z=zslice,
+        with image axes x and y.
+    zslice
+        Position of the cross section along z.
+    npixx, npixy
+        Number of pixels. By default npixy gives square pixels.
+    xlim, ylim
+        The extent of the image. Defaults to the extent of the particles.
+    weight
+        The interpolation weight m/(rho h^3), as a scalar or one value per
+        particle. Defaults to 1/hfact^3.
+    normalise
+        If True, divide by the interpolated weight.
+    tilesize
+        Size in pixels of the tiles.
+    workers
+        Number of threads. Defaults to the number of CPUs.
+    kernel
+        The smoothing kernel, the name of one in kernels.kernels or a
+        Kernel. Defaults to the cubic spline.
+
+    Returns
+    -------
+    ndarray
+        The images of both components, with shape (2, npixy, npixx).
+    """
+
+    kernel = get_kernel(kernel)
+
+    hh = dump['h']
+    xpos = dump[x]
+    ypos = dump[y]
+    zpos = dump[z]
+
+    vecx, vecy = [np.broadcast_to(component, hh.shape)
+                  for component in _get_vector(dump, vector, x, y)]
+    weight = np.broadcast_to(_get_weight(dump, weight), hh.shape)
+
+    limits = {label: lim for label, lim in [(x, xlim), (y, ylim), (z, (zslice, zslice))]
+              if lim is not None}
+    select = _cull(dump, limits, kernel)
+    xpos, ypos, zpos, hh, vecx, vecy, weight = _subset(select, xpos, ypos, zpos, hh,
+                                                       vecx, vecy, weight)
+
+    q2offset = np.zeros_like(hh)
+    np.divide((zpos - zslice)**2, hh**2, out=q2offset, where=hh > 0.)
+    near = (hh > 0.) & (q2offset < kernel.radkern2)
+    weight = weight[near]
+
+    xlim = _get_limits(xpos[near], hh[near], xlim, kernel.radkern)
+    ylim = _get_limits(ypos[near], hh[near], ylim, kernel.radkern)
+    npixy, pixwidthx, pixwidthy = _get_pixels(xlim, ylim, npixx, npixy)
+
+    weights = np.array([weight * vecx[near], weight * vecy[near], weight])
+
+    datsmooth = _interpolate2d_tiled(xpos[near], ypos[near], hh[near], weights,
+                                     xlim[0], ylim[0], pixwidthx, pixwidthy,
+                                     npixx, npixy, kernel.w,
+                                     q2offset=q2offset[near],
+                                     tilesize=tilesize, workers=workers)
+
+    if normalise:
+        return np.array([_normalise(datsmooth[0], datsmooth[2]),
+                         _normalise(datsmooth[1], datsmooth[2])])
+
+    return datsmooth[:2]
+
+
+def interpolate3d_grid(dump, quantity='density', shape=(128, 128, 128),
+                       bounds=None, x='x', y='y', z='z', weight=None,
+                       normalise=False, out=None, chunksize=None,
+                       tilesize=_tilesize, workers=None, kernel='cubic'):
+    """Interpolate a quantity onto a 3D grid.
+
+    The grid is filled in slabs of chunksize planes along z. Each plane is
+    a cross section rendered as in interpolate3d_fastxsec, and each slab
+    is written to out in one go. With out an h5py Dataset or a np.memmap,
+    grids larger than memory can be made, since only one slab is held in
+    memory at a time.
+
+    Parameters
+    ----------
+    dump
+        A Dump object.
+    quantity
+        The label of the quantity to interpolate, or an array with one
+        value per particle.
+    shape
+        Number of cells (nz, ny, nx) of the grid.
+    bounds
+        The extent ((xmin, xmax), (ymin, ymax), (zmin, zmax)) of the grid.
+        Defaults to the extent of the particles including their kernels.
+    x, y, z
+        Labels of the coordinates along the grid axes.
+    weight
+        The interpolation weight m/(rho h^3), as a scalar or one value per
+        particle. Defaults to 1/hfact^3.
+    normalise
+        If True, divide by the interpolated weight.
+    out
+        Optional array to write the grid into, with the given shape, e.g.
+        an h5py Dataset or a np.memmap. A new array is made by default.
+    chunksize
+        Number of planes in each slab. By default slabs hold about 64 MB.
+    tilesize
+        Size in pixels of the tiles rendered in parallel.
+    workers
+        Number of threads. Defaults to the number of CPUs.
+    kernel
+        The smoothing kernel, the name of one in kernels.kernels or a
+        Kernel. Defaults to the cubic spline.
+
+    Returns
+    -------
+    ndarray or out
+        The grid, indexed as [iz, iy, ix].
+    """
+
+    kernel = get_kernel(kernel)
+
+    nz, ny, nx = shape
+
+    if out is None:
+        out = np.zeros(shape)
+    elif tuple(out.shape) != tuple(shape):
+        raise ValueError("out has shape " + str(tuple(out.shape)) + ", "
+                         "but the grid has shape " + str(tuple(shape)) + ".")
+
+    hh = dump['h']
+    xpos = dump[x]
+    ypos = dump[y]
+    zpos = dump[z]
+
+    dat = np.broadcast_to(_get_quantity(dump, quantity), hh.shape)
+    weight = np.broadcast_to(_get_weight(dump, weight), hh.shape)
+
+    if bounds is None:
+        bounds = [None, None, None]
+    xlim, ylim, zlim = [_get_limits(position, hh, lim, kernel.radkern)
+                        for position, lim in zip([xpos, ypos, zpos], bounds)]
+
+    pixwidthx = (xlim[1] - xlim[0]) / nx
+    pixwidthy = (ylim[1] - ylim[0]) / ny
+    pixwidthz = (zlim[1] - zlim[0]) / nz
+
+    if chunksize is None:
+        chunksize = max(1, 2**23 // (nx * ny))
+
+    radius = kernel.radkern * hh
+
+    for k0 in range(0, nz, chunksize):
+        k1 = min(k0 + chunksize, nz)
+        zplanes = zlim[0] + (np.arange(k0, k1) + 0.5) * pixwidthz
+
+        # Particles whose kernel reaches a plane of this slab
+        limits = {x: xlim, y: ylim, z: (zplanes[0], zplanes[-1])}
+        select = _cull(dump, limits, kernel)
+        if select is None:
+            select = np.flatnonzero((zpos + radius >= zplanes[0])
+                                    & (zpos - radius <= zplanes[-1]))
+
+        xslab, yslab, zslab, hslab, datslab, weightslab = \
+            _subset(select, xpos, ypos, zpos, hh, dat, weight)
+
+        slab = np.zeros((k1 - k0, ny, nx))
+
+        for k, zplane in enumerate(zplanes):
+            q2offset = np.full_like(hslab, np.inf)
+            np.divide((zslab - zplane)**2, hslab**2, out=q2offset, where=hslab > 0.)
+            near = q2offset < kernel.radkern2
+
+            if normalise:
+                weights = np.array([weightslab[near] * datslab[near], weightslab[near]])
+            else:
+                weights = (weightslab[near] * datslab[near])[None, :]
+
+            datsmooth = _interpolate2d_tiled(xslab[near], yslab[near], hslab[near],
+                                             weights, xlim[0], ylim[0],
+                                             pixwidthx, pixwidthy, nx, ny, kernel.w,
+                                             q2offset=q2offset[near],
+                                             tilesize=tilesize, workers=workers)
+
+            if normalise:
+                slab[k] = _normalise(datsmooth[0], datsmooth[1])
+            else:
+                slab[k] = datsmooth[0]
+
+        out[k0:k1] = slab
+
+    return out
+
+
+# Front to back order of the particles of each dump along each axis, so that
+# rendering the same dump again with another quantity does not sort again
+_depth_orders = weakref.WeakKeyDictionary()
+
+
+def _depth_order(dump, z):
+    """ Indices of the particles of dump sorted from large to small z.
+
+    The order is cached for each dump and axis. Checking that it still
+    sorts the particles costs far less than sorting them, so it is sorted
+    again only if the data has been changed or replaced.
+    """
+    orders = _depth_orders.setdefault(dump, {})
+    depth = dump[z]
+
+    order = orders.get(z)
+    if order is not None and len(order) == len(depth) \
+            and np.all(np.diff(depth[order]) <= 0.):
+        return order
+
+    order = np.argsort(depth, kind='stable')[::-1].copy()
+    orders[z] = order
+
+    return order
+
+
+def interp3d_proj_opacity(dump, quantity='density', x='x', y='y', z='z',
+                          npixx=512, npixy=None, xlim=None, ylim=None,
+                          kappa=None, taupartdepth=1., kernel='cubic'):
+    """Render a projection of a quantity with opacity.
+
+    Each particle hides the particles behind it by exp(-dtau), with the
+    optical depth dtau = kappa m Y(q)/h^2 of its column-integrated kernel
+    Y. The observer looks along z from large z, i.e. the image is
+
+        sum over particles of dat (1 - exp(-dtau)) exp(-tau),
+
+    where tau is the optical depth of the particles in front. Particles are
+    sorted by z once, and then streamed from front to back in chunks, so
+    memory stays bounded however many particles overlap a pixel. The sort
+    order is cached with the dump, so rendering the same dump again with
+    another quantity does not sort again.
+
+    Parameters
+    ----------
+    dump
+        A Dump object.
+    quantity
+        The label of the quantity to render, or an array with one value per
+        particle.
+    x, y, z
+        Labels of the coordinates. The image axes are x and y, and z is
+        the line of sight.
+    npixx, npixy
+        Number of pixels. By default npixy gives square pixels.
+    xlim, ylim
+        The extent of the image. Defaults to the extent of the particles.
+    kappa
+        The opacity per unit mass. By default it is set so that the optical
+        depth through the centre of a particle with the mean mass and
+        smoothing length is taupartdepth.
+    taupartdepth
+        Optical depth through one particle, used when kappa is not given.
+    kernel
+        The smoothing kernel, the name of one in kernels.kernels or a
+        Kernel. Defaults to the cubic spline.
+
+    Returns
+    -------
+    ndarray
+        The image, with shape (npixy, npixx) so that rows follow y.
+    """
+
+    kernel = get_kernel(kernel)
+
+    xpos = dump[x]
+    ypos = dump[y]
+    hh = dump['h']
+
+    dat = np.broadcast_to(_get_quantity(dump, quantity), hh.shape)
+    mass = np.broadcast_to(dump['mass'], hh.shape)
+
+    xlim = _get_limits(xpos, hh, xlim, kernel.radkern)
+    ylim = _get_limits(ypos, hh, ylim, kernel.radkern)
+    npixy, pixwidthx, pixwidthy = _get_pixels(xlim, ylim, npixx, npixy)
+    npix = npixx * npixy
+
+    hmin = 0.5 * max(pixwidthx, pixwidthy)
+    hsmooth = np.maximum(hh, hmin)
+
+    # Particles with h <= 0 have been accreted, and are not rendered
+    order = _depth_order(dump, z)
+    order = order[hh[order] > 0.]
+    if len(order) == 0:
+        return np.zeros((npixy, npixx))
+
+    if kappa is None:
+        kappa = taupartdepth * np.mean(hh[order])**2 \
+            / (np.mean(mass[order]) * kernel.column.values[0])
+
+    # Split the sorted particles into chunks of about _batch_size
+    # particle-pixel pairs
+    footprint = (2 * np.ceil(kernel.radkern * hsmooth[order] / pixwidthx) + 1) \
+        * (2 * np.ceil(kernel.radkern * hsmooth[order] / pixwidthy) + 1)
+    bounds = np.searchsorted(np.cumsum(footprint),
+                             np.arange(_batch_size, footprint.sum(), _batch_size))
+    bounds = np.unique(np.concatenate([[0], bounds, [len(order)]]))
+
+    image = np.zeros(npix)
+    tau = np.zeros(npix)
+
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        chunk = order[start:end]
+        pairs = list(_kernel_pairs(xpos[chunk], ypos[chunk], hsmooth[chunk],
+                                   xlim[0], ylim[0], pixwidthx, pixwidthy,
+                                   npixx, npixy, kernel.column))
+
+        if len(pairs) == 0:
+            continue
+
+        # Within the chunk, the particle index is its rank in depth
+        pixel, particle, wab = [np.concatenate(a) for a in zip(*pairs)]
+        dtau = kappa * mass[chunk][particle] * wab / hsmooth[chunk][particle]**2
+
+        sort = np.argsort(pixel * len(chunk) + particle)
+        pixel, particle, dtau = pixel[sort], particle[sort], dtau[sort]
+
+        # Optical depth in front of each pair, from the chunks already done
+        # and the particles of this chunk in front of it in the same pixel
+        newpixel = np.ones(len(pixel), dtype=bool)
+        newpixel[1:] = pixel[1:] != pixel[:-1]
+        infront = np.cumsum(dtau) - dtau
+        infront -= infront[newpixel][np.cumsum(newpixel) - 1]
+        infront += tau[pixel]
+
+        image += np.bincount(pixel, minlength=npix,
+                             weights=dat[chunk][particle] * -np.expm1(-dtau) * np.exp(-infront))
+        tau += np.bincount(pixel, weights=dtau, minlength=npix)
+
+    return image.reshape(npixy, npixx)
+
+
+# Names of the coordinates of each geometry
+_geometries = {'cylindrical': ('r', 'phi', 'z'),
+               'spherical': ('r', 'theta', 'phi')}
+
+
+def _to_geometry(geometry, x, y, z):
+    """ Convert Cartesian positions to the coordinates of geometry. """
+    if geometry == 'cylindrical':
+        return {'r': np.hypot(x, y), 'phi': np.arctan2(y, x), 'z': z}
+
+    r = np.sqrt(x**2 + y**2 + z**2)
+    theta = np.arccos(np.divide(z, r, out=np.ones_like(r), where=r > 0.))
+    return {'r': r, 'theta': theta, 'phi': np.arctan2(y, x)}
+
+
+def _from_geometry(geometry, coords):
+    """ Convert the coordinates of geometry to Cartesian positions. """
+    if geometry == 'cylindrical':
+        r, phi = coords['r'], coords['phi']
+        return r * np.cos(phi), r * np.sin(phi), coords['z']
+
+    r, theta, phi = coords['r'], coords['theta'], coords['phi']
+    return (r * np.sin(theta) * np.cos(phi), r * np.sin(theta) * np.sin(phi),
+            r * np.cos(theta))
+
+
+def _geometry_extent(geometry, coords, radius):
+    """ Half-width of the box in each coordinate that contains each kernel.
+
+    Angles get a half-width of pi when the kernel contains the axis or the
+    origin, i.e. all angles.
+    """
+    r = coords['r']
+    angle = np.arcsin(np.minimum(radius / np.maximum(r, 1e-300), 1.))
+    angle[r <= radius] = np.pi
+
+    if geometry == 'cylindrical':
+        return {'r': radius, 'phi': angle, 'z': radius}
+
+    rcyl = r * np.sin(coords['theta'])
+    dphi = np.arcsin(np.minimum(radius / np.maximum(rcyl, 1e-300), 1.))
+    dphi[rcyl <= radius] = np.pi
+
+    return {'r': radius, 'theta': angle, 'phi': dphi}
+
+
+@functools.lru_cache(maxsize=16)
+def _geometry_table(geometry, x, y, zslice, xlim, ylim, npixx, npixy):
+    """ Cartesian positions of the pixel centres of a geometry image.
+
+    The result is cached, so a series of renders on the same grid does not
+    evaluate the trigonometric functions again. The arrays are read-only.
+    """
+    slicename, = set(_geometries[geometry]) - {x, y}
+
+    pixwidthx = (xlim[1] - xlim[0]) / npixx
+    pixwidthy = (ylim[1] - ylim[0]) / npixy
+
+    xpix, ypix = np.meshgrid(xlim[0] + (np.arange(npixx) + 0.5) * pixwidthx,
+                             ylim[0] + (np.arange(npixy) + 0.5) * pixwidthy)
+
+    coords = {x: xpix.ravel(), y: ypix.ravel(),
+              slicename: np.full(npixx * npixy, zslice)}
+
+    table = tuple(np.ascontiguousarray(a) for a in _from_geometry(geometry, coords))
+    for a in table:
+        a.flags.writeable = False
+
+    return table
+
+
+def _get_geometry_limits(name, coord, extent, lim):
+    """ Return lim, or the extent of the particles in coordinate name. """
+    if lim is not None:
+        return float(lim[0]), float(lim[1])
+    if name == 'phi':
+        return -np.pi, np.pi
+    if name == 'theta':
+        return 0., np.pi
+    if name == 'r':
+        return 0., float((coord + extent).max())
+    return float((coord - extent).min()), float((coord + extent).max())
+
+
+def _pixel_range(centre, half, lim, pixwidth, npix):
+    """ First and one past the last pixel with centre in [centre - half, centre + half).
+
+    As the range is half open, copies of a kernel shifted by its full width
+    never share a pixel.
+    """
+    first, end = [np.clip(np.ceil((edge - lim[0]) / pixwidth - 0.5), 0, npix).astype(np.intp)
+                  for edge in (centre - half, centre + half)]
+    return first, end
+
+
+def _box_pairs(imin, jmin, ni, nj, npixx, npixy):
+    """ Generate the pixels in a box around each particle.
+
+    Particle p covers the pixels imin[p] to imin[p]+ni[p]-1 in x, and
+    jmin[p] to jmin[p]+nj[p]-1 in y. Yields batches of (pixel, particle)
+    for the pixels inside the image, with boxes of the same size processed
+    together in batches of at most _batch_size pairs.
+    """
+
+    particles = np.flatnonzero((ni > 0) & (nj > 0))
+
+    if len(particles) == 0:
+        return
+
+    group = ni[particles] * (nj[particles].max() + 1) + nj[particles]
+    particles = particles[np.argsort(group, kind='stable')]
+    group = ni[particles] * (nj[particles].max() + 1) + nj[particles]
+    starts = np.flatnonzero(np.diff(group, prepend=-1))
+    ends = np.append(starts[1:], len(particles))
+
+    for start, end in zip(starts, ends):
+        offsetx = np.arange(ni[particles[start]])
+        offsety = np.arange(nj[particles[start]])
+
+        batch = max(1, _batch_size // (len(offsetx) * len(offsety)))
+
+        for first in range(start, end, batch):
+            p = particles[first:min(first + batch, end)]
+
+            ipix = imin[p][:, None] + offsetx[None, :]
+            jpix = jmin[p][:, None] + offsety[None, :]
+
+            valid = ((ipix >= 0) & (ipix < npixx))[:, None, :] \
+                & ((jpix >= 0) & (jpix < npixy))[:, :, None]
+
+            pixel = (jpix[:, :, None] * npixx + ipix[:, None, :])[valid]
+            particle = np.broadcast_to(p[:, None, None], valid.shape)[valid]
+
+            yield pixel, particle
+
+
+def _interpolate_geometry(dump, quantity, geometry, x, y, zslice, npixx, npixy,
+                          xlim, ylim, weight, normalise, xyz, projection, kernel):
+    """ Render a cross section or a projection in a non-Cartesian geometry. """
+
+    kernel = get_kernel(kernel)
+
+    if geometry not in _geometries:
+        raise ValueError("Unknown geometry " + str(geometry) + ". "
+                         "Use one of " + str(list(_geometries)) + ".")
+
+    names = _geometries[geometry]
+    if x not in names or y not in names or x == y:
+        raise ValueError("x and y must be two of " + str(names) + " for "
+                         + geometry + " geometry.")
+
+    slicename, = set(names) - {x, y}
+
+    if projection and (geometry, slicename) != ('cylindrical', 'z'):
+        raise ValueError("Projections are only supported along z in "
+                         "cylindrical geometry.")
+
+    xpos, ypos, zpos = [dump[label] for label in xyz]
+    hh = dump['h']
+
+    coords = _to_geometry(geometry, xpos, ypos, zpos)
+    extent = _geometry_extent(geometry, coords, kernel.radkern * hh)
+
+    # Only keep particles whose kernel reaches the cross section
+    near = hh > 0.
+    if not projection:
+        distance = coords[slicename] - zslice
+        if slicename == 'phi':
+            distance = (distance + np.pi) % (2. * np.pi) - np.pi
+        near &= np.abs(distance) <= extent[slicename]
+
+    names, dats = _get_quantities(dump, quantity, hh.shape)
+    weight = np.broadcast_to(_get_weight(dump, weight), hh.shape)
+
+    xlim = _get_geometry_limits(x, coords[x][near], extent[x][near], xlim)
+    ylim = _get_geometry_limits(y, coords[y][near], extent[y][near], ylim)
+    npixy, pixwidthx, pixwidthy = _get_pixels(xlim, ylim, npixx, npixy)
+
+    tablex, tabley, tablez = _geometry_table(geometry, x, y, float(zslice),
+                                             xlim, ylim, npixx, npixy)
+
+    particles = np.flatnonzero(near)
+    centres = [coords[x][particles], coords[y][particles]]
+    halves = [extent[x][particles], extent[y][particles]]
+
+    if 'phi' in (x, y):
+        particles, centres, halves = _wrap_phi(particles, centres, halves,
+                                               [x, y].index('phi'), [xlim, ylim])
+
+    imin, iend = _pixel_range(centres[0], halves[0], xlim, pixwidthx, npixx)
+    jmin, jend = _pixel_range(centres[1], halves[1], ylim, pixwidthy, npixy)
+
+    if projection:
+        table = kernel.column
+        termnorm = weight * hh
+    else:
+        table = kernel.w
+        termnorm = weight
+
+    weights = [termnorm * dat for dat in dats] + ([termnorm] if normalise else [])
+
+    # A projection only uses the distance in x and y
+    positions = [xpos, ypos] if projection else [xpos, ypos, zpos]
+    tables = [tablex, tabley] if projection else [tablex, tabley, tablez]
+
+    datsmooth = _deposit_geometry(particles, positions, hh, weights, tables,
+                                  imin, jmin, iend, jend, npixx, npixy,
+                                  kernel.radkern2, table)
+
+    return _results(datsmooth, names, normalise)
+
+
+def _wrap_phi(particles, centres, halves, axis, limits):
+    """Add the kernels that cross phi = +-pi again, shifted by 2 pi.
+
+    These appear on both sides of the image. axis is the index of phi in
+    centres and halves, which hold the centre and half width of each
+    kernel along x and y.
+    """
+    lim = limits[axis]
+    centre, half = centres[axis], halves[axis]
+    centres, halves = list(centres), list(halves)
+
+    for shift in [-2. * np.pi, 2. * np.pi]:
+        index = np.flatnonzero((centre + shift + half >= lim[0])
+                               & (centre + shift - half <= lim[1]))
+        particles = np.append(particles, particles[index])
+        centres[1 - axis] = np.append(centres[1 - axis], centres[1 - axis][index])
+        halves[1 - axis] = np.append(halves[1 - axis], halves[1 - axis][index])
+        centres[axis] = np.append(centres[axis], centre[index] + shift)
+        halves[axis] = np.append(halves[axis], half[index])
+
+    return particles, centres, halves
+
+
+def _deposit_geometry(particles, positions, hh, weights, tables, imin, jmin,
+                      iend, jend, npixx, npixy, radkern2, table):
+    """Deposit particles onto the pixels of their boxes.
+
+    positions holds the Cartesian coordinates of every particle, and tables
+    those of every pixel centre, along the same axes. Returns an array of
+    shape (len(weights), npixy, npixx).
+    """
+    npix = npixx * npixy
+    datsmooth = np.zeros((len(weights), npix))
+
+    for pixel, owner in _box_pairs(imin, jmin, iend - imin, jend - jmin,
+                                   npixx, npixy):
+        p = particles[owner]
+        hi1 = 1. / hh[p]
+
+        q2 = sum(((tab[pixel] - pos[p]) * hi1)**2 for tab, pos in zip(tables, positions))
+
+        inside = q2 < radkern2
+        pixel, p = pixel[inside], p[inside]
+        wab = table(q2[inside])
+
+        for k in range(len(weights)):
+            datsmooth[k] += np.bincount(pixel, weights=wab * weights[k][p],
+                                        minlength=npix)
+
+    return datsmooth.reshape(len(weights), npixy, npixx)
+
+
+def interpolate3D_proj_geom(dump, quantity='density', geometry='cylindrical',
+                            x='r', y='phi', npixx=512, npixy=None, xlim=None,
+                            ylim=None, weight=None, normalise=False,
+                            xyz=('x', 'y', 'z'), kernel='cubic'):
+    """Render the column integral of a quantity on a non-Cartesian grid.
+
+    Currently the projection is along z onto an r-phi grid in cylindrical
+    geometry, e.g. the surface density of a disc in polar coordinates.
+    The Cartesian positions of the pixel centres are cached, so a series
+    of renders on the same grid does not recompute them.
+
+    Parameters
+    ----------
+    dump
+        A Dump object.
+    quantity
+        The label of the quantity to render, or an array with one value per
+        particle. A list of quantities is rendered in a single pass over
+        the particles, and returned as a dict keyed by label, or by
+        position in the list for arrays.
+    geometry
+        'cylindrical', with coordinates r, phi and z.
+    x, y
+        The coordinates along the image axes, 'r' and 'phi' in either order.
+    npixx, npixy
+        Number of pixels. By default npixy gives square pixels.
+    xlim, ylim
+        The extent of the image. Defaults to the extent of the particles in
+        r, and -pi to pi in phi.
+    weight
+        The interpolation weight m/(rho h^3), as a scalar or one value per
+        particle. Defaults to 1/hfact^3.
+    normalise
+        If True, divide by the interpolated weight.
+    xyz
+        Labels of the Cartesian coordinates of the particles.
+    kernel
+        The smoothing kernel, the name of one in kernels.kernels or a
+        Kernel. Defaults to the cubic spline.
+
+    Returns
+    -------
+    ndarray or dict
+        The image, with shape (npixy, npixx) so that rows follow y, or a
+        dict of images for a list of quantities.
+    """
+
+    return _interpolate_geometry(dump, quantity, geometry, x, y, 0., npixx,
+                                 npixy, xlim, ylim, weight, normalise, xyz,
+                                 projection=True, kernel=kernel)
+
+
+def interpolate3D_xsec_geom(dump, quantity='density', geometry='cylindrical',
+                            x='r', y='phi', zslice=0., npixx=512, npixy=None,
+                            xlim=None, ylim=None, weight=None, normalise=False,
+                            xyz=('x', 'y', 'z'), kernel='cubic'):
+    """Render a cross section of a quantity on a non-Cartesian grid.
+
+    The cross section is the surface where the coordinate not used for the
+    image axes equals zslice, e.g. x='r', y='z' with phi=zslice for a
+    vertical slice through a disc. The Cartesian positions of the pixel
+    centres are cached, so a series of renders on the same grid does not
+    recompute them.
+
+    Parameters
+    ----------
+    dump
+        A Dump object.
+    quantity
+        The label of the quantity to render, or an array with one value per
+        particle. A list of quantities is rendered in a single pass over
+        the particles, and returned as a dict keyed by label, or by
+        position in the list for arrays.
+    geometry
+        'cylindrical', with coordinates r, phi and z, or 'spherical', with
+        coordinates r, theta and phi, where theta is measured from the z
+        axis.
+    x, y
+        The coordinates along the image axes.
+    zslice
+        Value of the remaining coordinate on the cross section.
+    npixx, npixy
+        Number of pixels. By default npixy gives square pixels.
+    xlim, ylim
+        The extent of the image. Defaults to the extent of the particles,
+        0 to pi in theta, and -pi to pi in phi.
+    weight
+        The interpolation weight m/(rho h^3), as a scalar or one value per
+        particle. Defaults to 1/hfact^3.
+    normalise
+        If True, divide by the interpolated weight.
+    xyz
+        Labels of the Cartesian coordinates of the particles.
+    kernel
+        The smoothing kernel, the name of one in kernels.kernels or a
+        Kernel. Defaults to the cubic spline.
+
+    Returns
+    -------
+    ndarray or dict
+        The image, with shape (npixy, npixx) so that rows follow y, or a
+        dict of images for a list of quantities.
+    """
+
+    return _interpolate_geometry(dump, quantity, geometry, x, y, zslice, npixx,
+                                 npixy, xlim, ylim, weight, normalise, xyz,
+                                 projection=False, kernel=kernel)
@@ -0,0 +1,210 @@
+"""
+Smoothing kernels for the interpolation routines.
+
+Each kernel is tabulated once as a function of q^2, both in 3D and
+integrated along the line of sight, and is then evaluated by linear
+interpolation in the tables. The tables are stored on disk, so they are
+only computed the first time a kernel is used on a machine.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+
+# Number of entries in the kernel tables
+ntable = 4096
+
+# Increase when the tables change, so old files on disk are not used
+_table_version = 1
+
+# Directory for the tables, or None to not store them on disk
+_cachedir = os.path.join(os.path.expanduser('~'), '.cache', 'pysplashsph')
+
+
+def set_kernel_cachedir(cachedir):
+    """ Set the directory the kernel tables are stored in, or None to not store them. """
+    global _cachedir
+    _cachedir = cachedir
+
+
+class KernelTable:
+    """A kernel tabulated in q^2, from 0 to radkern^2.
+
+    Calling the table with q^2 interpolates it linearly, and gives zero
+    outside the kernel.
+    """
+
+    def __init__(self, values, radkern):
+        self.values = values
+        self.radkern = radkern
+        self.radkern2 = radkern * radkern
+
+    def __call__(self, q2):
+        n = len(self.values)
+        position = np.minimum(q2, self.radkern2) * ((n - 1) / self.radkern2)
+        index = np.minimum(position.astype(np.intp), n - 2)
+        fraction = position - index
+        return self.values[index] * (1. - fraction) + self.values[index + 1] * fraction
+
+
+class Kernel:
+    """A 3D smoothing kernel and its tables.
+
+    Parameters
+    ----------
+    name
+        Name of the kernel, also used for its tables on disk.
+    function
+        The kernel as a function of q, normalised in 3D but without the
+        factor 1/h^3.
+    radkern
+        Radius of the kernel in units of h.
+
+    Attributes
+    ----------
+    w
+        KernelTable of the kernel, as a function of q^2.
+    column
+        KernelTable of the kernel integrated through a line of sight at
+        distance q, as a function of q^2. The column integral of a particle
+        is column(q^2)/h^2.
+    """
+
+    def __init__(self, name, function, radkern):
+        self.name = name
+        self.function = function
+        self.radkern = radkern
+        self.radkern2 = radkern * radkern
+
+        self._w = None
+        self._column = None
+
+    def __repr__(self):
+        return 'Kernel(' + repr(self.name) + ')'
+
+    @property
+    def w(self):
+        if self._w is None:
+            self._load()
+        return self._w
+
+    @property
+    def column(self):
+        if self._column is None:
+            self._load()
+        return self._column
+
+    def _load(self):
+        tables = _read_tables(self.name)
+        if tables is None:
+            tables = self._tabulate()
+            _write_tables(self.name, tables)
+
+        self._w = KernelTable(tables[0], self.radkern)
+        self._column = KernelTable(tables[1], self.radkern)
+
+    def _tabulate(self, nz=513):
+        q2 = np.linspace(0., self.radkern2, ntable)
+        w = self.function(np.sqrt(q2))
+
+        # Integrate along the line of sight from 0 to the edge of the
+        # kernel with the trapezoidal rule, doubled for the other half
+        zmax = np.sqrt(self.radkern2 - q2)
+        z = zmax[:, None] * np.linspace(0., 1., nz)[None, :]
+        wz = self.function(np.sqrt(q2[:, None] + z**2))
+        column = 2. * zmax / (nz - 1) * (wz.sum(axis=1) - 0.5 * (wz[:, 0] + wz[:, -1]))
+
+        return np.array([w, column])
+
+
+def _table_path(name):
+    return os.path.join(_cachedir, 'kernel_' + name + '_' + str(ntable)
+                        + '_v' + str(_table_version) + '.npy')
+
+
+def _read_tables(name):
+    if _cachedir is None:
+        return None
+
+    try:
+        tables = np.load(_table_path(name))
+    except (OSError, ValueError):
+        return None
+
+    if tables.shape != (2, ntable):
+        return None
+
+    return tables
+
+
+def _write_tables(name, tables):
+    if _cachedir is None:
+        return
+
+    # Write to a temporary file first, so other processes never read a
+    # partly written table. The tables are cheap to recompute, so they are
+    # simply not stored if the directory cannot be written.
+    try:
+        os.makedirs(_cachedir, exist_ok=True)
+        fd, tmppath = tempfile.mkstemp(suffix='.npy', dir=_cachedir)
+    except OSError:
+        return
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, tables)
+        os.replace(tmppath, _table_path(name))
+    except OSError:
+        os.remove(tmppath)
+
+
+def _cubic(q):
+    """ M4 cubic spline. """
+    return np.where(q < 1., 1. - 1.5 * q**2 + 0.75 * q**3,
+                    np.where(q < 2., 0.25 * (2. - q)**3, 0.)) / np.pi
+
+
+def _quintic(q):
+    """ M6 quintic spline. """
+    w = np.where(q < 3., (3. - q)**5, 0.)
+    w -= np.where(q < 2., 6. * (2. - q)**5, 0.)
+    w += np.where(q < 1., 15. * (1. - q)**5, 0.)
+    return w / (120. * np.pi)
+
+
+def _wendland2(q):
+    """ Wendland C2, with compact support at q = 2. """
+    return np.where(q < 2., (1. - 0.5 * q)**4 * (2. * q + 1.), 0.) * 21. / (16. * np.pi)
+
+
+def _wendland4(q):
+    """ Wendland C4, with compact support at q = 2. """
+    return np.where(q < 2., (1. - 0.5 * q)**6 * (35. / 12. * q**2 + 3. * q + 1.), 0.) \
+        * 495. / (256. * np.pi)
+
+
+def _wendland6(q):
+    """ Wendland C6, with compact support at q = 2. """
+    return np.where(q < 2., (1. - 0.5 * q)**8 * (4. * q**3 + 6.25 * q**2 + 4. * q + 1.), 0.) \
+        * 1365. / (512. * np.pi)
+
+
+kernels = {'cubic': Kernel('cubic', _cubic, 2.),
+           'quintic': Kernel('quintic', _quintic, 3.),
+           'wendland2': Kernel('wendland2', _wendland2, 2.),
+           'wendland4': Kernel('wendland4', _wendland4, 2.),
+           'wendland6': Kernel('wendland6', _wendland6, 2.)}
+
+
+def get_kernel(kernel):
+    """ Return the Kernel called kernel, or kernel itself if it is a Kernel. """
+    if isinstance(kernel, Kernel):
+        return kernel
+
+    if kernel not in kernels:
+        raise ValueError("Unknown kernel " + str(kernel) + ". "
+                         "Use one of " + str(list(kernels)) + ".")
+
+    return kernels[kernel]
@@ -0,0 +1,248 @@
+"""
+Multi-resolution rendering for interactive viewing.
+
+An ImagePyramid renders a projection as square tiles at a series of
+resolutions, each level with twice the resolution of the one before.
+Tiles are only rendered when they are viewed, and are kept so that panning
+and zooming back does not render them again.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+from .interpolation import (_interpolate2d, _get_quantity, _get_weight,
+                            _get_limits, _normalise)
+from .kernels import get_kernel
+
+
+class ImagePyramid:
+    """Lazily rendered multi-resolution projection of a dump.
+
+    Level 0 is a single tile of tilesize x tilesize pixels covering the
+    whole domain, and level L has 2^L x 2^L tiles. Particles whose
+    smoothing length is below point_fraction of a pixel are deposited into
+    the pixel containing them as points, which keeps the coarse levels
+    cheap when a pixel holds many particles.
+
+    Parameters
+    ----------
+    dump
+        A Dump object.
+    quantity
+        The label of the quantity to render, or an array with one value per
+        particle.
+    x, y
+        Labels of the coordinates used for the image axes.
+    xlim, ylim
+        The extent of the domain. Defaults to a square containing all the
+        particles and their kernels.
+    tilesize
+        Number of pixels along each side of a tile.
+    maxlevel
+        The finest level.
+    weight
+        The interpolation weight m/(rho h^3), as for interpolate3d_projection.
+    normalise
+        If True, divide by the interpolated weight.
+    point_fraction
+        Particles with h below this fraction of a pixel are deposited as
+        points.
+    maxtiles
+        Number of rendered tiles that are kept.
+    kernel
+        The smoothing kernel, the name of one in kernels.kernels or a
+        Kernel. Defaults to the cubic spline.
+    """
+
+    def __init__(self, dump, quantity='density', x='x', y='y', xlim=None,
+                 ylim=None, tilesize=256, maxlevel=10, weight=None,
+                 normalise=False, point_fraction=0.25, maxtiles=256,
+                 kernel='cubic'):
+
+        self.kernel = get_kernel(kernel)
+
+        self.xpos = dump[x]
+        self.ypos = dump[y]
+        self.hh = dump['h']
+
+        dat = np.broadcast_to(_get_quantity(dump, quantity), self.hh.shape)
+        weight = np.broadcast_to(_get_weight(dump, weight), self.hh.shape)
+
+        # The integral of each particle over the image
+        self.term = weight * self.hh**3 * dat
+        self.termnorm = weight * self.hh**3 if normalise else None
+
+        if xlim is None or ylim is None:
+            xmin, xmax = _get_limits(self.xpos, self.hh, xlim, self.kernel.radkern)
+            ymin, ymax = _get_limits(self.ypos, self.hh, ylim, self.kernel.radkern)
+            width = max(xmax - xmin, ymax - ymin)
+            xlim = (xmin, xmin + width) if xlim is None else xlim
+            ylim = (ymin, ymin + width) if ylim is None else ylim
+
+        self.xlim = (float(xlim[0]), float(xlim[1]))
+        self.ylim = (float(ylim[0]), float(ylim[1]))
+        self.tilesize = tilesize
+        self.maxlevel = maxlevel
+        self.point_fraction = point_fraction
+        self.maxtiles = maxtiles
+
+        # Cull the particles of each tile with the tree of the dump, if it
+        # has already been built or loaded over these axes, as _cull does
+        self._tree = None
+        self._axes = None
+        tree = dump.tree if getattr(dump, 'has_tree', False) else None
+        if tree is not None and tree.labels is not None \
+                and x in tree.labels and y in tree.labels \
+                and tree.radkern >= self.kernel.radkern:
+            self._tree = tree
+            self._axes = (tree.labels.index(x), tree.labels.index(y))
+
+        self._tiles = OrderedDict()
+
+    def tile_extent(self, level, i, j):
+        """ The extent (xmin, xmax, ymin, ymax) of tile (i, j) of a level. """
+        ntiles = 2**level
+        widthx = (self.xlim[1] - self.xlim[0]) / ntiles
+        widthy = (self.ylim[1] - self.ylim[0]) / ntiles
+        return (self.xlim[0] + i * widthx, self.xlim[0] + (i + 1) * widthx,
+                self.ylim[0] + j * widthy, self.ylim[0] + (j + 1) * widthy)
+
+    def tile(self, level, i, j):
+        """Return tile (i, j) of a level, rendering it if needed.
+
+        i counts along x and j along y. The tile has shape
+        (tilesize, tilesize), with rows following y.
+        """
+        if not 0 <= level <= self.maxlevel:
+            raise ValueError("level must be between 0 and " + str(self.maxlevel) + ".")
+
+        if not (0 <= i < 2**level and 0 <= j < 2**level):
+            raise IndexError("Tile (" + str(i) + ", " + str(j) + ") is not in level "
+                             + str(level) + ".")
+
+        key = (level, i, j)
+        if key in self._tiles:
+            self._tiles.move_to_end(key)
+            return self._tiles[key]
+
+        image = self._render(*self.tile_extent(level, i, j))
+        image.flags.writeable = False
+
+        self._tiles[key] = image
+        while len(self._tiles) > self.maxtiles:
+            self._tiles.popitem(last=False)
+
+        return image
+
+    def level_for(self, pixwidth):
+        """ The coarsest level with pixels no larger than pixwidth. """
+        width = (self.xlim[1] - self.xlim[0]) / self.tilesize
+        level = int(np.ceil(np.log2(width / pixwidth))) if pixwidth < width else 0
+        return min(level, self.maxlevel)
+
+    def view(self, xlim, ylim, npixx=512):
+        """Render the part of the domain inside xlim and ylim.
+
+        The level is chosen so the view has at least npixx pixels across,
+        and only the tiles overlapping the view are rendered.
+
+        Returns
+        -------
+        image : ndarray
+            The pixels overlapping the view, with rows following y.
+        extent : tuple
+            The extent (xmin, xmax, ymin, ymax) of image, e.g. for imshow.
+        """
+        level = self.level_for((xlim[1] - xlim[0]) / npixx)
+        ntiles = 2**level
+        npix = ntiles * self.tilesize
+
+        pixwidthx = (self.xlim[1] - self.xlim[0]) / npix
+        pixwidthy = (self.ylim[1] - self.ylim[0]) / npix
+
+        # Range of pixels of the whole level that overlap the view
+        imin, imax = [int(np.clip(np.floor((lim - self.xlim[0]) / pixwidthx), 0, npix - 1))
+                      for lim in xlim]
+        jmin, jmax = [int(np.clip(np.floor((lim - self.ylim[0]) / pixwidthy), 0, npix - 1))
+                      for lim in ylim]
+
+        image = np.empty((jmax - jmin + 1, imax - imin + 1))
+
+        for j in range(jmin // self.tilesize, jmax // self.tilesize + 1):
+            for i in range(imin // self.tilesize, imax // self.tilesize + 1):
+                tile = self.tile(level, i, j)
+
+                # Part of the tile inside the view, in pixels of the level
+                i0 = max(imin, i * self.tilesize)
+                i1 = min(imax + 1, (i + 1) * self.tilesize)
+                j0 = max(jmin, j * self.tilesize)
+                j1 = min(jmax + 1, (j + 1) * self.tilesize)
+
+                image[j0 - jmin:j1 - jmin, i0 - imin:i1 - imin] = \
+                    tile[j0 - j * self.tilesize:j1 - j * self.tilesize,
+                         i0 - i * self.tilesize:i1 - i * self.tilesize]
+
+        extent = (self.xlim[0] + imin * pixwidthx, self.xlim[0] + (imax + 1) * pixwidthx,
+                  self.ylim[0] + jmin * pixwidthy, self.ylim[0] + (jmax + 1) * pixwidthy)
+
+        return image, extent
+
+    def clear(self):
+        """ Drop the rendered tiles. """
+        self._tiles.clear()
+
+    def _render(self, xmin, xmax, ymin, ymax):
+        npix = self.tilesize
+        pixwidthx = (xmax - xmin) / npix
+        pixwidthy = (ymax - ymin) / npix
+        hmin = 0.5 * max(pixwidthx, pixwidthy)
+
+        if self._tree is None:
+            select = slice(None)
+        else:
+            margin = self.kernel.radkern * hmin
+            lo = np.full(len(self._tree.labels), -np.inf)
+            hi = np.full(len(self._tree.labels), np.inf)
+            lo[list(self._axes)] = xmin - margin, ymin - margin
+            hi[list(self._axes)] = xmax + margin, ymax + margin
+            select = self._tree.box(lo, hi)
+
+        x = self.xpos[select]
+        y = self.ypos[select]
+        hh = self.hh[select]
+        terms = [self.term[select]]
+        if self.termnorm is not None:
+            terms.append(self.termnorm[select])
+        terms = np.array(terms)
+
+        datsmooth = np.zeros((len(terms), npix, npix))
+
+        # Particles with h <= 0 have been accreted, and are not rendered
+        rendered = hh > 0.
+
+        # Particles much smaller than a pixel go into the pixel containing
+        # them, spread over the pixel area
+        point = rendered & (hh < self.point_fraction * min(pixwidthx, pixwidthy))
+        ipix = np.floor((x[point] - xmin) / pixwidthx).astype(np.intp)
+        jpix = np.floor((y[point] - ymin) / pixwidthy).astype(np.intp)
+        inside = (ipix >= 0) & (ipix < npix) & (jpix >= 0) & (jpix < npix)
+        pixel = jpix[inside] * npix + ipix[inside]
+
+        for k, term in enumerate(terms):
+            datsmooth[k] += np.bincount(pixel, weights=term[point][inside],
+                                        minlength=npix * npix).reshape(npix, npix) \
+                / (pixwidthx * pixwidthy)
+
+        # The rest are smoothed as in interpolate3d_projection
+        smooth = rendered & ~point
+        hsmooth = np.maximum(hh[smooth], hmin)
+        datsmooth += _interpolate2d(x[smooth], y[smooth], hsmooth,
+                                    terms[:, smooth] / hsmooth**2,
+                                    xmin, ymin, pixwidthx, pixwidthy,
+                                    npix, npix, self.kernel.column)
+
+        if self.termnorm is not None:
+            return _normalise(datsmooth[0], datsmooth[1])
+
+        return datsmooth[0]
@@ -16,6 +16,8 @@ except OSError:
     print("PySplashSPH ERROR: Could not load `libread.so`")
     sys.exit(1)
 
-from .read import read_data
+from .read import (read_data, read_hdf5, read_many, iter_dumps, scan_headers,
+                   register_quantity)
 
-__all__ = ['read_data']
+__all__ = ['read_data', 'read_hdf5', 'read_many', 'iter_dumps', 'scan_headers',
+           'register_quantity']
@@ -0,0 +1,116 @@
+"""
+An on-disk cache of dumps read with libread.
+
+Reading a dump through libread parses the whole file every time. With
+read_data(..., cache=True) the particle data is also stored as a .npy
+file, next to the dump or in a cache directory, with a JSON file holding
+the labels and headers. Later reads memory-map the .npy file instead of
+parsing the dump again, as long as the dump has the same modification
+time and size.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+
+# Increase when the format of the cache changes, so old files are not used
+_cache_version = 1
+
+
+def _cache_paths(filepath, cache_dir):
+    """ Paths of the JSON header and the .npy data cached for filepath. """
+    if cache_dir is None:
+        base = filepath + '.pysplashsph'
+    else:
+        # Dumps in different directories often have the same name
+        digest = hashlib.sha1(os.path.abspath(filepath).encode('utf-8')).hexdigest()
+        base = os.path.join(cache_dir, os.path.basename(filepath) + '-' + digest[:12])
+
+    return base + '.json', base + '.npy'
+
+
+def source_stamp(filepath):
+    """ The modification time and size of a dump, which key its cache. """
+    stat = os.stat(filepath)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def load_cache(filepath, filetype, cache_dir=None):
+    """Return (data, labels, headers) cached for a dump, or None.
+
+    data is memory-mapped copy-on-write, so it is only read from disk as
+    it is used, and changing it does not change the cache. None is
+    returned if there is no cache, or if the dump has changed since it was
+    cached.
+    """
+    headerpath, datapath = _cache_paths(filepath, cache_dir)
+
+    try:
+        with open(headerpath) as f:
+            header = json.load(f)
+        stamp = source_stamp(filepath)
+    except (OSError, ValueError):
+        return None
+
+    if header.get('version') != _cache_version \
+            or header.get('filetype') != filetype.lower() \
+            or header.get('source') != stamp:
+        return None
+
+    try:
+        data = np.load(datapath, mmap_mode='c')
+    except (OSError, ValueError):
+        return None
+
+    if list(data.shape) != header['shape'] or data.dtype != np.float64:
+        return None
+
+    return data, header['labels'], header['headers']
+
+
+def save_cache(filepath, filetype, data, labels, headers, stamp, cache_dir=None):
+    """Store the data, labels and headers of a dump in the cache.
+
+    stamp is the source_stamp of the dump from before it was read, so a
+    dump changed while it was read is read again next time. The dump is
+    not cached if the cache directory cannot be written, since it can
+    always be read again.
+    """
+    headerpath, datapath = _cache_paths(filepath, cache_dir)
+    directory = os.path.dirname(headerpath) or '.'
+
+    header = {'version': _cache_version,
+              'filetype': filetype.lower(),
+              'source': stamp,
+              'shape': list(data.shape),
+              'labels': list(labels),
+              'headers': {key: float(value) for key, value in headers.items()}}
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+
+        # The data is written before the header, and each through a
+        # temporary file, so a header is never found next to partial data
+        for path, write in [(datapath, lambda f: np.save(f, data)),
+                            (headerpath, lambda f: f.write(json.dumps(header).encode('utf-8')))]:
+            fd, tmppath = tempfile.mkstemp(suffix=os.path.splitext(path)[1], dir=directory)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    write(f)
+                os.replace(tmppath, path)
+            except BaseException:
+                os.remove(tmppath)
+                raise
+    except OSError:
+        return
+
+
+def remove_cache(filepath, cache_dir=None):
+    """ Remove the cache of a dump, if there is one. """
+    for path in _cache_paths(filepath, cache_dir):
+        if os.path.exists(path):
+            os.remove(path)
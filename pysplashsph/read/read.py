@@ -1,5 +1,7 @@
+import io
 import os.path
-import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
 
 # from pathlib import Path
 
@@ -7,12 +9,25 @@ from ctypes import (c_int, c_float, c_bool, c_double, c_char_p,
                         byref, POINTER, pointer, cast, c_char)
 
 from . import _libread as libread
-from ..utils import stdchannel_redirected
+from . import cache as _cache
+from ..utils import stdchannel_redirected, KDTree
 import numpy as np
 import h5py
 from pandas import DataFrame
 import time
 
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    # shared_memory is only available from Python 3.8
+    shared_memory = None
+
+try:
+    import hdf5plugin
+except ImportError:
+    # Only needed for blosc compression of HDF5 files
+    hdf5plugin = None
+
 # Global constants that specify the length of strings in some of the
 # SPLASH subroutines. Changing these could break the code and lead to a
 # Segmentation Fault
@@ -20,21 +35,68 @@ ltags = 16
 lenlabel = 80
 lenunitslabel = 40
 
+# Number of particles in each chunk of compressed HDF5 datasets
+hdf5_chunksize = 2**16
+
 
 class Dump:
     """PySPLASH Dump object. Contains SPH data, labels, units, and other
     attributes.
 
-
+    The particle data is stored with one row per column, and dump[label]
+    returns a view of the row. Derived quantities that are not columns,
+    e.g. 'density', 'mass', 'r', 'R', 'vmag' and 'temperature', are
+    computed the first time they are used and kept until a column is set
+    with dump[label] = values, the data or labels are replaced, or
+    invalidate is called. More can be added with register_quantity.
     """
 
+    __slots__ = ['_data', '_labels', 'headers', 'filepath', 'filetype',
+                 '_index', '_columns', '_derived', '_as_dataframe', '_as_hdf5',
+                 '_tree', '_tree_data', '__weakref__']
+
+    # Functions computing the quantities that are not columns, by name
+    _quantities = {}
+
     def __init__(self, data=None, labels=None, headers=None, filepath=None, filetype=None):
-        self.data = data
-        self.labels = labels
+        self._data = data
+        self._labels = None if labels is None else list(labels)
         self.headers = headers
         self.filepath = filepath
         self.filetype = filetype
 
+        self._tree = None
+        self._tree_data = None
+
+        self._reset()
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._reset()
+
+    @property
+    def labels(self):
+        return self._labels
+
+    @labels.setter
+    def labels(self, labels):
+        self._labels = None if labels is None else list(labels)
+        self._reset()
+
+    def _reset(self):
+        """ Drop the column views and everything computed from the data. """
+        self._index = {}
+        if self._labels is not None:
+            for col, label in enumerate(self._labels):
+                self._index.setdefault(label, col)
+
+        self._columns = None
+        self._derived = {}
         self._as_dataframe = None
         self._as_hdf5 = None
 
@@ -42,20 +104,55 @@ class Dump:
         if name in ['headers', 'header']:
             return self.headers
 
-        if name in self.labels:
-            try:
-                col = self.labels.index(name)
-            except ValueError:
-                print("Label {} not a column name in dumpfile".format(name))
-                raise
+        col = self._index.get(name)
+        if col is not None:
+            return self._column(col)
 
-            return self.data[col]
+        if name in self._derived:
+            return self._derived[name]
 
-        if self.as_dataframe is not None:
-            return self.as_dataframe[name].values
-        else:
-            self._to_dataframe()
-            return self.as_dataframe[name].values
+        if name in self._quantities:
+            value = self._quantities[name](self)
+            self._derived[name] = value
+            return value
+
+        raise KeyError("Label {} not a column name in dumpfile".format(name))
+
+    def _column(self, col):
+        if self._columns is None:
+            self._columns = list(self._data)
+        return self._columns[col]
+
+    def __setitem__(self, name, values):
+        """ Overwrite the column called name, in place. """
+        col = self._index.get(name)
+        if col is None:
+            raise KeyError("Label {} not a column name in dumpfile".format(name))
+
+        self._data[col] = values
+        self.invalidate(tree=name in ['x', 'y', 'z', 'h'])
+
+    def invalidate(self, name=None, tree=True):
+        """Drop cached derived quantities, so they are computed again.
+
+        Call this after changing the data in place through dump.data.
+
+        Parameters
+        ----------
+        name
+            The derived quantity to drop. Defaults to all of them.
+        tree
+            If True, also drop the tree when name is None.
+        """
+        if name is not None:
+            self._derived.pop(name, None)
+            return
+
+        self._derived = {}
+        self._as_dataframe = None
+        self._as_hdf5 = None
+        if tree:
+            self._tree = None
 
     @property
     def as_dataframe(self):
@@ -69,45 +166,273 @@ class Dump:
             self._as_hdf5 = self._to_hdf5_dataset()
         return self._as_hdf5
 
+    @property
+    def tree(self):
+        """ A KDTree of the particle positions, built the first time it is used.
+
+        The tree includes the smoothing lengths, so it can cull the
+        particles whose kernel overlaps a region. It is built again if
+        data has been replaced.
+        """
+        if not self.has_tree:
+            labels, positions, h = self._tree_arrays()
+            self._tree = KDTree(positions, h=h, labels=labels)
+            self._tree_data = self._data
+        return self._tree
+
+    @property
+    def has_tree(self):
+        """ Whether the tree has been built or loaded for the current data. """
+        return self._tree is not None and self._tree_data is self._data
+
+    def _tree_arrays(self):
+        labels = [label for label in ['x', 'y', 'z'] if label in self.labels]
+        positions = np.array([self[label] for label in labels])
+        h = self['h'] if 'h' in self.labels else None
+        return labels, positions, h
+
+    def load_tree(self, filename):
+        """ Load the tree saved with save_hdf5, instead of building it. """
+        labels, positions, h = self._tree_arrays()
+        with h5py.File(filename, 'r') as f:
+            if 'tree' not in f:
+                raise KeyError("No tree stored in " + str(filename) + ".")
+            self._tree = KDTree.from_hdf5(f['tree'], positions, h=h)
+        self._tree_data = self._data
+
     def _to_hdf5_dataset(self):
-        fname = os.path.basename(self.filepath) + b'.h5'
-        tf = tempfile.NamedTemporaryFile()
-        f = h5py.File(tf, 'w')
-        f = _dump2hdf5(f, self)
-        return f
-
-    def save_hdf5(self, filename):
-        if self.filetype is 'phantom':
+        # The file is only held in memory, for as long as the dump keeps it
+        return _dump2hdf5(h5py.File(io.BytesIO(), 'w'), self)
+
+    def save_hdf5(self, filename, tree=None, compression=None):
+        """ Save the dump to an HDF5 file.
+
+        The particle data is written straight into the file, one column at
+        a time. The tree is stored as well if tree is True, or by default
+        if it has already been built, so it can be reloaded with load_tree.
+
+        Parameters
+        ----------
+        filename
+            The path of the file to write.
+        tree
+            Whether to store the tree.
+        compression
+            None to store the particle data uncompressed, so read_hdf5 can
+            memory-map it, or 'gzip', 'lzf' or 'blosc' to compress it in
+            chunks. 'blosc' needs the hdf5plugin package.
+        """
+        options = _compression_options(compression)
+
+        if _is_phantom(self):
             print("Warning: save_hdf5 cannot be used to rerun phantom simulations. ")
 
-        dump_hdf5 = self.as_hdf5
-
         with h5py.File(filename, "w") as f:
-            for group_name in dump_hdf5:
-                f_a = f.create_group(group_name)
-                for dataset in dump_hdf5[group_name]:
-                    f_a.create_dataset(dataset, data=dump_hdf5[group_name][dataset])
+            _dump2hdf5(f, self, options)
+
+            if tree or (tree is None and self.has_tree):
+                self._particles_tree().to_hdf5(f.create_group('tree'))
+
+    def _particles_tree(self):
+        """ The tree of the particles group written by save_hdf5. """
+        if not _is_phantom(self):
+            return self.tree
+
+        order, nsinks = _phantom_order(self)
+        if order is None and nsinks == 0:
+            return self.tree
+
+        # The particles group holds the particles sorted by type, without
+        # the sinks, so the tree of the dump does not apply to it
+        select = slice(0, len(self['itype']) - nsinks) if order is None \
+            else order[:len(order) - nsinks]
+        labels, positions, h = self._tree_arrays()
+        return KDTree(positions[:, select], h=None if h is None else h[select],
+                      labels=labels)
+
+
+def _particle_mass(dump):
+    """ Mass of each particle, from a mass column or the massoftype headers. """
+    for label in ['particle mass', 'mass', 'pmass']:
+        if label in dump.labels:
+            return dump[label]
+
+    headers = dump.headers or {}
+
+    # e.g. massoftype, massoftype2, ..., for particle types 1, 2, ...
+    massoftype = {}
+    for key in headers:
+        if not key.startswith('massoftype'):
+            continue
+
+        value = np.asarray(headers[key])
+        if value.ndim > 0:
+            # Phantom HDF5 files store one array with the mass of every type
+            massoftype.update((itype + 1, float(mass)) for itype, mass in enumerate(value))
+        else:
+            suffix = key[len('massoftype'):]
+            itype = int(suffix) if suffix.isdigit() else 1
+            massoftype[itype] = float(value)
+
+    if len(massoftype) == 0:
+        raise KeyError("Could not find the particle mass in the dump.")
+
+    if len(massoftype) == 1 or 'itype' not in dump.labels:
+        return np.full(len(dump['h']), massoftype[min(massoftype)])
+
+    itype = dump['itype'].astype(np.intp)
+    masses = np.zeros(max(max(massoftype), itype.max()) + 1)
+    for i in massoftype:
+        masses[i] = massoftype[i]
+
+    return masses[itype]
+
+
+def _density(dump):
+    """Density set by the smoothing length, rho = m (hfact/|h|)^3.
 
+    As in Phantom, accreted particles are flagged by h < 0 and keep the
+    density they had.
+    """
+    hfact = dump.headers.get('hfact', 1.2) if dump.headers else 1.2
+    return dump['mass'] * (hfact / np.abs(dump['h']))**3
+
+
+def _radius(dump):
+    """ Spherical radius, from the position columns the dump has. """
+    return np.sqrt(sum(dump[label]**2 for label in ['x', 'y', 'z'] if label in dump.labels))
+
+
+def _cylindrical_radius(dump):
+    """ Cylindrical radius in the x-y plane. """
+    return np.sqrt(dump['x']**2 + dump['y']**2)
+
+
+def _speed(dump):
+    """Magnitude of the velocity, from the velocity columns the dump has.
+
+    SPLASH labels the components v_x, v_y and v_z, and other files vx, vy
+    and vz.
+    """
+    labels = [label for axis in ['x', 'y', 'z'] for label in ['v' + axis, 'v_' + axis]
+              if label in dump.labels]
+    if len(labels) == 0:
+        raise KeyError("Could not find the velocity in the dump.")
+    return np.sqrt(sum(dump[label]**2 for label in labels))
+
+
+# Boltzmann constant and proton mass in cgs units, as in Phantom
+kboltz = 1.38066e-16
+mass_proton_cgs = 1.67262158e-24
+
+
+def _temperature(dump):
+    """Temperature in K from the internal energy, for an ideal gas.
+
+    Uses gamma and the mean molecular weight gmw from the headers if they
+    are there, otherwise 5/3 and 2.381, and the code units udist and utime
+    to convert u to cgs.
+    """
+    if 'u' not in dump.labels:
+        raise KeyError("Could not find the internal energy in the dump.")
+
+    headers = dump.headers or {}
+    if 'udist' not in headers or 'utime' not in headers:
+        raise KeyError("The dump headers do not give the units udist and utime.")
+
+    gamma = headers.get('gamma', 5./3.)
+    gmw = headers.get('gmw', 2.381)
+    unit_ergg = (headers['udist'] / headers['utime'])**2
+
+    return dump['u'] * unit_ergg * (gamma - 1.) * gmw * mass_proton_cgs / kboltz
+
+
+def register_quantity(name, function):
+    """Register a derived quantity that dump[name] computes and caches.
+
+    Parameters
+    ----------
+    name
+        The name of the quantity. Columns of a dump with the same label
+        take precedence over it.
+    function
+        Function called with the Dump, returning an array with one value
+        per particle.
+    """
+    Dump._quantities[name] = function
+
+
+register_quantity('mass', _particle_mass)
+register_quantity('density', _density)
+register_quantity('rho', lambda dump: dump['density'])
+register_quantity('r', _radius)
+register_quantity('R', _cylindrical_radius)
+register_quantity('vmag', _speed)
+register_quantity('temperature', _temperature)
+
+
+def _is_phantom(dump):
+    filetype = dump.filetype
+    if isinstance(filetype, bytes):
+        filetype = filetype.decode()
+    return filetype is not None and filetype.lower() == 'phantom'
+
+
+def _compression_options(compression):
+    """ Keyword arguments of create_dataset for a compression method. """
+    if compression is None:
+        return {}
+
+    if compression in ['gzip', 'lzf']:
+        return {'compression': compression}
+
+    if compression == 'blosc':
+        if hdf5plugin is None:
+            raise ImportError("blosc compression needs the hdf5plugin package.")
+        return dict(hdf5plugin.Blosc())
+
+    raise ValueError("Unknown compression " + str(compression) + ". "
+                     "Use None, 'gzip', 'lzf' or 'blosc'.")
+
+
+def _create_dataset(f_a, name, data, options, shape=None, dtype=None):
+    """Create a particle dataset, in chunks along the particles if it is compressed.
+
+    If data is None, an empty dataset with the given shape and dtype is
+    created, to be written afterwards.
+    """
+    if data is not None:
+        shape = np.shape(data)
 
-def _dump2hdf5(f, dump):
-    """ Convert the attributes of the Dump class into an HDF5 File object. """
+    if len(options) > 0 and np.prod(shape) > 0:
+        chunks = (min(shape[0], hdf5_chunksize),) + tuple(shape[1:])
+        return f_a.create_dataset(name, shape=shape, dtype=dtype, data=data,
+                                  chunks=chunks, **options)
+    return f_a.create_dataset(name, shape=shape, dtype=dtype, data=data)
+
+
+def _dump2hdf5(f, dump, options={}):
+    """ Convert the attributes of the Dump class into an HDF5 File object.
+
+    options are the compression options of the particle datasets.
+    """
 
     if dump.headers is not None:
         f_header = f.create_group('header')
         for header in dump.headers:
             f_header.create_dataset(header, data=dump.headers[header])
 
-    if dump.filetype.lower().decode() == 'phantom':
-        return _phantom2hdf5(f, dump)
+    if _is_phantom(dump):
+        return _phantom2hdf5(f, dump, options)
 
-    f_particles = f.create_group('particles')
+    f_particles = f.create_group('particles', track_order=True)
 
-    _store_remainder(f_particles, dump)
+    _store_remainder(f_particles, dump, options=options)
 
     return f
 
 
-def _phantom2hdf5(f, dump):
+def _phantom2hdf5(f, dump, options={}):
     """ A simple tool for converting to HDF5 format for use in other codes (e.g. Plonk)
 
     NOTE: This is not a replacement for phantom2hdf5, and not all of the contents
@@ -117,64 +442,85 @@ def _phantom2hdf5(f, dump):
 
     _store_extra_header_quantities(f['header'], dump)
 
-    # Mask out the sink particles so we can store them in a different Group
-    sink_mask = dump['itype'] == 3
-    sink_indices = np.where(sink_mask)
+    order, nsinks = _phantom_order(dump)
+    npart = len(dump['itype'])
 
-    ignore_labels = []
+    groups = [('particles', 0, npart - nsinks)]
+    if nsinks > 0:
+        groups.insert(0, ('sinks', npart - nsinks, npart))
 
-    if len(sink_indices) > 0:
-        f_sinks = f_particles = f.create_group('sinks')
+    # Positions and velocities are stored together in (n, 3) datasets
+    vectors = {'xyz': ['x', 'y', 'z']}
+    if 'vx' in dump.labels:
+        # If velocity is present, it is a full dump
+        vectors['vxyz'] = ['vx', 'vy', 'vz']
+        vectors['divv'] = ['divv']
 
-        # Ignore x, y, z, since they are added into the xyz group
-        ignore_labels.extend(['x', 'y', 'z'])
+    ignore_labels = [label for labels in vectors.values() for label in labels]
+    vectors.update((label, [label]) for label in dump.labels if label not in ignore_labels)
 
-        sink_xyz_data = np.array([dump['x'][sink_indices], dump['y'][sink_indices], dump['z'][sink_indices]]).T
-        f_sinks.create_dataset('xyz', data=sink_xyz_data)
+    for group_name, start, end in groups:
+        f_a = f.create_group(group_name, track_order=True)
+        for name, labels in vectors.items():
+            _write_partition(f_a, name, [dump[label] for label in labels],
+                             order, start, end, options)
 
-        if 'vx' in dump.labels:
-            # If velocity is present, it is a full dump
-            _store_fulldump(f_sinks, dump, mask=sink_mask, ignore_labels=ignore_labels)
+    return f
 
-        _store_remainder(f_sinks, dump, mask=sink_mask, ignore_labels=ignore_labels)
 
+def _phantom_order(dump):
+    """Order in which _phantom2hdf5 writes the particles, and the number of sinks.
 
-    # Find particles based off our sink mask made earlier
-    particle_mask = np.logical_not(sink_mask)
-    particle_indices = np.where(particle_mask)
+    The particles are sorted by type, with the sink particles last, so that
+    each type is a contiguous slice. The sinks are stored in a different
+    Group. The order is None if the particles are already sorted, in which
+    case the groups are written from views of the columns.
+    """
+    itype = dump['itype']
+    sink_mask = itype == 3
+    key = np.where(sink_mask, np.inf, itype)
 
-    f_particles = f.create_group('particles')
+    if np.all(key[1:] >= key[:-1]):
+        order = None
+    else:
+        order = np.argsort(key, kind='stable')
 
-    # Ignore x, y, z, since they are added into the xyz group
-    ignore_labels.extend(['x', 'y', 'z'])
+    return order, np.count_nonzero(sink_mask)
 
-    particle_xyz_data = np.array([dump['x'][particle_indices], dump['y'][particle_indices], dump['z'][particle_indices]]).T
-    f_particles.create_dataset('xyz', data=particle_xyz_data)
 
-    if 'vx' in dump.labels:
-        _store_fulldump(f_particles, dump, mask=particle_mask, ignore_labels=ignore_labels)
+def _write_partition(f_a, name, columns, order, start, end, options):
+    """Write particles start to end of the sorted columns to a dataset.
 
-    _store_remainder(f_particles, dump, mask=particle_mask, ignore_labels=ignore_labels)
+    One column is stored as a 1D dataset and several as an (n, ncolumns)
+    one. The particles are taken from the columns in blocks through order,
+    or as a view if order is None, so no column is ever copied whole.
+    """
+    if order is None and len(columns) == 1:
+        return _create_dataset(f_a, name, columns[0][start:end], options)
 
-    return f
+    n = end - start
+    shape = (n,) if len(columns) == 1 else (n, len(columns))
+    dataset = _create_dataset(f_a, name, None, options, shape=shape, dtype=columns[0].dtype)
 
+    for i0 in range(0, n, hdf5_chunksize):
+        i1 = min(i0 + hdf5_chunksize, n)
+        select = slice(start + i0, start + i1) if order is None \
+            else order[start + i0:start + i1]
 
-def _store_fulldump(f_a, dump, mask=None, ignore_labels=[]):
-    """ Store velocity components of a fulldump """
-    f_a.create_dataset('vxyz', data=np.array([dump['vx'][mask], dump['vy'][mask], dump['vz'][mask]]))
-    f_a.create_dataset('divv', data=dump['divv'][mask])
-    # f_a.create_dataset('dt', data=dump['dt'][mask])
+        if len(columns) == 1:
+            dataset[i0:i1] = columns[0][select]
+        else:
+            dataset[i0:i1] = np.stack([column[select] for column in columns], axis=1)
 
-    if len(ignore_labels) > 0:
-        # Ignore these quantites since they are added into groups
-        ignore_labels.extend(['vx', 'vy', 'vz', 'divv']) # , 'dt'])
+    return dataset
 
 
-def _store_remainder(f_a, dump, mask=None, ignore_labels=[]):
+def _store_remainder(f_a, dump, ignore_labels=[], options={}):
     """ Store additional labels from dump if they are not already in the HDF5 file object """
     for label in dump.labels:
-        if label not in (f_a.keys() and ignore_labels):
-            f_a.create_dataset(label, data=np.array(dump[label][mask]))
+        if label not in f_a and label not in ignore_labels:
+            # The column is written straight from the dump
+            _create_dataset(f_a, label, dump[label], options)
 
 
 def _store_extra_header_quantities(f_a, dump):
@@ -192,7 +538,8 @@ def _store_extra_header_quantities(f_a, dump):
 
 
 def read_data(filepath, filetype='Phantom', use_HDF5=False,
-                     ncol=None, npart=None, verbose=False):
+                     ncol=None, npart=None, verbose=False, out=None,
+                     columns=None, cache=False, cache_dir=None):
     """Generate a Snap object from a Phantom HDF5 file.
     Parameters
     ----------
@@ -203,11 +550,27 @@ def read_data(filepath, filetype='Phantom', use_HDF5=False,
         otherwise a binary data format supported by SPLASH can be read
     use_HDF5
         Boolean to specify whether to use the HDF5 library to read files.
+        The file is then read lazily, as with read_hdf5.
     ncol, npart
         The number of columns and particles in the data. Incorrectly
         specifying these can lead to a Segmentation Fault
     verbose
         Specify if you want libread to provide output to the terminal
+    out
+        Optional C-contiguous float64 numpy array that the particle data
+        is written into. It must hold at least ncol*npart values, so a
+        buffer sized for the largest dump can be reused between snapshots.
+    columns
+        Optional list of labels to keep, e.g. ['x', 'y', 'z', 'h']. The
+        returned Dump only holds these columns, in the order given. Only
+        used when reading binary formats.
+    cache
+        If True, binary formats are stored in a cache the first time they
+        are read, and later reads memory-map the cache instead of parsing
+        the file again. The cache is read again if the file has a different
+        modification time or size.
+    cache_dir
+        Directory for the cache. Defaults to storing it next to the file.
 
     Returns
     -------
@@ -225,20 +588,291 @@ def read_data(filepath, filetype='Phantom', use_HDF5=False,
         #                    use_HDF5 is True:
         return read_hdf5(filepath)
 
+    elif cache:
+        return _read_cached(filepath, filetype, cache_dir, ncol=ncol, npart=npart,
+                            verbose=verbose, out=out, columns=columns)
+
     else:
         return read_data_binary(filepath, filetype=filetype,
-                             ncol=None, npart=None, verbose=False)
+                             ncol=ncol, npart=npart, verbose=verbose, out=out,
+                             columns=columns)
+
+
+def _read_cached(filepath, filetype, cache_dir, ncol=None, npart=None,
+                 verbose=False, out=None, columns=None):
+    """ read_data_binary through the cache, storing the dump on a miss. """
+    cached = _cache.load_cache(filepath, filetype, cache_dir=cache_dir)
+
+    if cached is None:
+        stamp = _cache.source_stamp(filepath)
+        dump = read_data_binary(filepath, filetype=filetype, ncol=ncol, npart=npart,
+                                verbose=verbose, out=out)
+        _cache.save_cache(filepath, filetype, dump.data, dump.labels, dump.headers,
+                          stamp, cache_dir=cache_dir)
+        data, labels, headers = dump.data, dump.labels, dump.headers
+    else:
+        data, labels, headers = cached
+        if verbose:
+            print("Read " + str(filepath) + " from the cache")
+
+        if out is not None:
+            mapped = data
+            data = _output_buffer(out, *mapped.shape)
+            data[...] = mapped
+
+    if columns is not None:
+        data, labels = _select_columns(data, labels, columns, in_place=out is not None)
+
+    return Dump(data=data, labels=labels, headers=headers,
+                filepath=filepath.encode('utf-8'), filetype=filetype.encode('utf-8'))
+
+
+# Datasets that hold several columns, as (npart, ncomponents) arrays
+_vector_datasets = {'xyz': ['x', 'y', 'z'], 'vxyz': ['vx', 'vy', 'vz']}
 
 
-def read_hdf5(filepath):
+class HDF5Dump(Dump):
+    """Dump read lazily from an HDF5 file written by Dump.save_hdf5.
+
+    Columns are only read when they are first used. Uncompressed datasets
+    are memory-mapped, so only the parts that are used are read from disk,
+    while compressed datasets are read whole. A tree stored in the file is
+    loaded instead of being built.
+
+    Parameters
+    ----------
+    filepath
+        The path to the file.
+    group
+        The group of particles to read, e.g. 'particles' or 'sinks'.
+    """
+
+    __slots__ = ['group', '_sources', '_stored_tree']
+
+    def __init__(self, filepath, group='particles'):
+        with h5py.File(filepath, 'r') as f:
+            if group not in f:
+                raise KeyError("No group " + str(group) + " in " + str(filepath) + ".")
+
+            headers = None
+            if 'header' in f:
+                headers = {key: f['header'][key][()] for key in f['header']}
+
+            # The dataset each column is stored in, and its component there
+            labels = []
+            sources = []
+            for name, dataset in f[group].items():
+                if name in _vector_datasets and dataset.ndim == 2:
+                    for component, label in enumerate(_vector_datasets[name]):
+                        labels.append(label)
+                        sources.append((name, component))
+                else:
+                    labels.append(name)
+                    sources.append((name, None))
+
+            stored_tree = 'tree' in f
+
+        super().__init__(labels=labels, headers=headers, filepath=filepath,
+                         filetype='HDF5')
+
+        self.group = group
+        self._sources = sources
+        self._stored_tree = stored_tree
+
+    @property
+    def data(self):
+        """ All the columns as one array, read into memory the first time it is used. """
+        if self._data is None:
+            had_tree = self.has_tree
+            self._data = np.array([self._column(col) for col in range(len(self._labels))])
+            self._columns = None
+            if had_tree:
+                self._tree_data = self._data
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        Dump.data.fset(self, data)
+
+    @property
+    def tree(self):
+        if not self.has_tree and self._stored_tree:
+            try:
+                self.load_tree(self.filepath)
+            except ValueError:
+                # The tree was stored for a different set of particles
+                self._stored_tree = False
+        return Dump.tree.fget(self)
+
+    def _column(self, col):
+        if self._data is not None:
+            return super()._column(col)
+
+        if self._columns is None:
+            self._columns = [None] * len(self._labels)
+
+        if self._columns[col] is None:
+            name = self._sources[col][0]
+            with h5py.File(self.filepath, 'r') as f:
+                dataset = f[self.group][name]
+                values = _map_dataset(self.filepath, dataset)
+                if values is None:
+                    values = dataset[()]
+
+            # Every column stored in the dataset is now available
+            for i, (source, component) in enumerate(self._sources):
+                if source == name:
+                    self._columns[i] = values if component is None else values[:, component]
+
+        return self._columns[col]
+
+    def __setitem__(self, name, values):
+        # The mapped columns are read-only, so read them into memory first
+        self.data
+        super().__setitem__(name, values)
+
+
+def _map_dataset(filepath, dataset):
+    """ Memory-map a contiguous, uncompressed dataset, or return None if it cannot be. """
+    if dataset.chunks is not None or dataset.size == 0:
+        return None
+
+    offset = dataset.id.get_offset()
+    if offset is None:
+        return None
+
+    return np.memmap(filepath, mode='r', dtype=dataset.dtype, offset=offset,
+                     shape=dataset.shape)
+
+
+def read_hdf5(filepath, group='particles'):
+    """Read an HDF5 file written by Dump.save_hdf5.
+
+    Parameters
+    ----------
+    filepath
+        The path to the file.
+    group
+        The group of particles to read, e.g. 'particles' or 'sinks'.
+
+    Returns
+    -------
+    HDF5Dump
+        A Dump that reads its columns from the file when they are used.
+    """
     if not h5py.is_hdf5(filepath):
         raise TypeError("File given is not an HDF5 file.")
 
-    return h5py.File(filepath, mode='r')
+    return HDF5Dump(filepath, group=group)
+
+
+def _set_read_data_argtypes():
+    """ Tell ctypes what data types we are going to send to our Fortran code.
+
+    Fortran read_data subroutine arguments are:
+    filename,fileformat,f_length, ff_length,&
+    sph_dat,npart,ncol,read_header,verbose,ierr
+
+    sph_dat is passed as a plain pointer, so the same argtypes work for
+    any array size and numpy arrays can be handed over without a copy.
+    """
+    libread.read_data.argtypes = \
+            [c_char_p, c_char_p, POINTER(c_int), POINTER(c_int),
+             POINTER(c_double), POINTER(c_int), POINTER(c_int),
+             POINTER(c_int), POINTER(c_int), POINTER(c_int)]
+
+
+def _output_buffer(out, ncol, npart):
+    """ Return a (ncol, npart) float64 array for libread to write into.
+
+    If out is None a new array is allocated with np.empty, so the memory is
+    only touched once by the Fortran reader. Otherwise the leading
+    ncol*npart values of out are used, so a buffer can be reused for
+    dumps with differing numbers of particles.
+    """
+    if out is None:
+        return np.empty((ncol, npart), dtype=np.float64)
+
+    if not isinstance(out, np.ndarray):
+        raise TypeError("out must be a numpy array.")
+
+    if out.dtype != np.float64 or not out.flags['C_CONTIGUOUS'] \
+            or not out.flags['WRITEABLE']:
+        raise ValueError("out must be a writeable, C-contiguous float64 array.")
+
+    if out.size < ncol * npart:
+        raise ValueError("out has " + str(out.size) + " elements, but "
+                         + str(ncol * npart) + " are needed to hold the data.")
+
+    return out.reshape(-1)[:ncol * npart].reshape(ncol, npart)
+
+
+def _select_columns(sph_data, labels, columns, in_place=False):
+    """ Keep only the requested columns of sph_data.
+
+    If in_place is True the selected columns are packed into the front of
+    sph_data, so that a caller-supplied buffer keeps holding the data.
+    Otherwise they are copied into a new array and the full array can be
+    freed.
+    """
+    missing = [column for column in columns if column not in labels]
+    if len(missing) > 0:
+        raise ValueError("Columns " + str(missing) + " not in dumpfile. "
+                         "Available columns are " + str(labels))
+
+    indices = [labels.index(column) for column in columns]
+
+    if indices == list(range(len(labels))):
+        return sph_data, labels
+
+    if in_place:
+        sph_data[:len(indices)] = sph_data[indices]
+        sph_data = sph_data[:len(indices)]
+    else:
+        sph_data = sph_data.take(indices, axis=0)
+
+    return sph_data, list(columns)
+
+
+def _read_header(filepath, filetype, verbose_int):
+    """ Call libread.read_data in header mode to get ncol and npart.
+
+    This first call will not result in the data actually being loaded
+    for some data formats, e.g. Phantom, SPHng, gadget, and others.
+    filepath and filetype must already be encoded as bytes.
+    """
+    f_length = c_int(len(filepath))
+    ff_length = c_int(len(filetype))
+
+    ncol = c_int(0)
+    npart = c_int(0)
+
+    sph_dat = np.empty((0, 0), dtype=np.float64) # Order of ncol and npart matters here
+
+    # Capture error flag with an integer
+    ierr = c_int(0)
+
+    # Indicate that we just want to read the header to get ncol and npart
+    read_header = c_int(1)
+
+    _set_read_data_argtypes()
+
+    with stdchannel_redirected():
+        libread.read_data(c_char_p(filepath), c_char_p(filetype),
+                          byref(f_length), byref(ff_length),
+                          sph_dat.ctypes.data_as(POINTER(c_double)),
+                          byref(npart), byref(ncol),
+                          byref(read_header), byref(verbose_int), byref(ierr))
+
+    if ierr.value == 1:
+        raise RuntimeError("Error encountered in SPLASH.")
+
+    return ncol, npart
 
 
 def read_data_binary(filepath, filetype='Phantom',
-                     ncol=None, npart=None, verbose=False):
+                     ncol=None, npart=None, verbose=False, out=None,
+                     columns=None):
 
     filepath = filepath.encode('utf-8')
     filetype = filetype.encode('utf-8')
@@ -254,64 +888,25 @@ def read_data_binary(filepath, filetype='Phantom',
         print_warnings = False
         verbose_int = c_int(0)
 
+    _set_read_data_argtypes()
+
     # We need to know the amount of memory to allocate. If this is not yet
     # given, we need to find out how much to allocate.
     if ncol is None or npart is None:
         # ncol and npart will be obtained from our first call to libread.read_data
-        # This first call will not result in the data actually being loaded
-        # for some data formats, e.g.
-        # Phantom, SPHng, gadget, and others,
-
-        ncol_in = 0
-        npart_in = 0
-
-        ncol_in_c = c_int(ncol_in)
-        npart_in_c = c_int(npart_in)
-
-        # Fortran read_data subroutine arguments are:
-        # filename,fileformat,f_length, ff_length,&
-        # sph_dat,npart,ncol,read_header,verbose,ierr
-
-        # Tell ctypes what data types we are going to send to our Fortran code
-        libread.read_data.argtypes = \
-                [c_char_p, c_char_p, POINTER(c_int), POINTER(c_int),
-                 POINTER(c_double * npart_in * ncol_in), POINTER(c_int), POINTER(c_int),
-                 POINTER(c_int), POINTER(c_int), POINTER(c_int)]
-
-        sph_dat = (c_double * npart_in * ncol_in)() # Order of npart and ncol matters here
-
-        # Capture error flag with an integer
-        ierr = c_int(0)
-
-        # Indicate that we just want to read the header to get ncol and npart
-        read_header = c_int(1)
-
-        with stdchannel_redirected():
-            libread.read_data(c_char_p(filepath), c_char_p(filetype),
-                              byref(f_length), byref(ff_length),
-                              byref(sph_dat),
-                              byref(npart_in_c), byref(ncol_in_c),
-                              byref(read_header), byref(verbose_int), byref(ierr))
-
-
-        if verbose: print("Got file size, ncol="+ str(ncol_in_c) +
-                            ", npart=" + str(npart_in_c))
+        ncol, npart = _read_header(filepath, filetype, verbose_int)
 
-        ncol = ncol_in_c
-        npart = npart_in_c
+        if verbose: print("Got file size, ncol="+ str(ncol) +
+                            ", npart=" + str(npart))
 
     else:
         # If ncol and npart are given, convert to c_int
         npart = c_int(npart)
         ncol = c_int(ncol)
 
-    # Update argtypes based on array size
-    libread.read_data.argtypes = \
-            [c_char_p, c_char_p, POINTER(c_int), POINTER(c_int),
-             POINTER(c_double * npart.value * ncol.value), POINTER(c_int), POINTER(c_int),
-             POINTER(c_int), POINTER(c_int), POINTER(c_int)]
-
-    sph_dat = (c_double * npart.value * ncol.value)()
+    # Fortran writes column by column, so a C-ordered (ncol, npart) array
+    # matches its (npart, ncol) layout
+    sph_data = _output_buffer(out, ncol.value, npart.value)
 
     ierr = c_int(0)
     read_header = c_int(0)
@@ -319,19 +914,23 @@ def read_data_binary(filepath, filetype='Phantom',
     with stdchannel_redirected(print_warnings=print_warnings):
         libread.read_data(c_char_p(filepath), c_char_p(filetype), # strings
                               byref(f_length), byref(ff_length), # length of previous strings
-                              byref(sph_dat), # An array with the size of the SPH data
+                              sph_data.ctypes.data_as(POINTER(c_double)), # An array with the size of the SPH data
                               byref(npart), byref(ncol), # the size of sph_dat
                               byref(read_header), byref(verbose_int), byref(ierr))
 
-    if ierr == 1:
+    if ierr.value == 1:
         raise RuntimeError("Error encountered in SPLASH.")
 
-    # Turn data into a numpy array
-    sph_data = np.ctypeslib.as_array(sph_dat) # .T
-
     labels = get_labels(ncol.value-1) # subtract 1 since itype is not included
 
     labels.append('itype') # Last column is always particle type
+
+    if columns is not None:
+        # libread always reads every column, so drop the unwanted ones
+        # before they are handed back to the user
+        sph_data, labels = _select_columns(sph_data, labels, columns,
+                                           in_place=out is not None)
+
     header_tags, header_vals = get_headers()
 
     dump = Dump(data=sph_data, labels=labels,
@@ -341,6 +940,331 @@ def read_data_binary(filepath, filetype='Phantom',
     return dump
 
 
+def scan_headers(paths, filetype='Phantom', workers=None, verbose=False):
+    """Read only the header of each dump, without loading particle data.
+
+    Parameters
+    ----------
+    paths
+        A list of paths to dump files.
+    filetype
+        The format of the files, as for read_data.
+    workers
+        Number of worker processes used to scan the files. libread keeps
+        its state in global Fortran modules, so files are scanned in
+        separate processes rather than threads. If None, the files are
+        scanned one after the other in this process.
+    verbose
+        Specify if you want libread to provide output to the terminal
+
+    Returns
+    -------
+    list of dict
+        One dict per path, in the order given, with the keys 'filepath',
+        'time', 'npart', 'ncol', 'labels' and 'headers'.
+    """
+
+    paths = [str(path) for path in paths]
+
+    for path in paths:
+        if not os.path.exists(path):
+            raise FileNotFoundError("filepath " + path + " does not exist.")
+
+    if workers is None or workers <= 1:
+        return [_scan_header(path, filetype, verbose) for path in paths]
+
+    # Hand the files out in batches, so the cost of talking to the worker
+    # processes is small compared to reading the headers
+    chunksize = max(1, len(paths) // (4 * workers))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_scan_header, paths,
+                                 [filetype] * len(paths),
+                                 [verbose] * len(paths),
+                                 chunksize=chunksize))
+
+
+def _scan_header(filepath, filetype, verbose):
+    """ Return the header information of a single dump. """
+
+    verbose_int = c_int(1) if verbose else c_int(0)
+
+    ncol, npart = _read_header(filepath.encode('utf-8'),
+                               filetype.encode('utf-8'), verbose_int)
+
+    labels = []
+    if ncol.value > 0:
+        labels = get_labels(ncol.value-1) # subtract 1 since itype is not included
+        labels.append('itype')
+
+    header_tags, header_vals = get_headers()
+    headers = dict(zip(header_tags, header_vals))
+
+    return {'filepath': filepath,
+            'time': headers.get('time'),
+            'npart': npart.value,
+            'ncol': ncol.value,
+            'labels': labels,
+            'headers': headers}
+
+
+def read_many(paths, filetype='Phantom', workers=None, columns=None):
+    """Read several dumps in parallel, each in its own worker process.
+
+    libread keeps its state in global Fortran modules, so dumps cannot be
+    read from several threads at once. Instead each dump is read by a
+    separate process, which writes the particle data into shared memory
+    so it does not have to be pickled on the way back.
+
+    Parameters
+    ----------
+    paths
+        A list of paths to dump files.
+    filetype
+        The format of the files, as for read_data.
+    workers
+        Number of worker processes. Defaults to the number of CPUs.
+    columns
+        Optional list of labels to keep, as for read_data.
+
+    Returns
+    -------
+    list of Dump
+        One Dump per path, in the order given.
+    """
+
+    paths = [str(path) for path in paths]
+
+    for path in paths:
+        if not os.path.exists(path):
+            raise FileNotFoundError("filepath " + path + " does not exist.")
+
+    if workers is None:
+        workers = os.cpu_count()
+
+    if workers <= 1:
+        return [read_data_binary(path, filetype=filetype, columns=columns)
+                for path in paths]
+
+    if shared_memory is not None:
+        # Start the resource tracker before the workers are created, so they
+        # share it with this process. Otherwise each worker starts its own,
+        # which removes the shared memory blocks when the worker exits.
+        resource_tracker.ensure_running()
+
+    dumps = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_read_shared, path, filetype, columns)
+                   for path in paths]
+        try:
+            for future in futures:
+                dumps.append(_dump_from_shared(future.result()))
+        finally:
+            # If something went wrong, release the shared memory of any
+            # dumps that were read but never collected
+            _discard_shared(futures[len(dumps):])
+
+    return dumps
+
+
+def iter_dumps(paths, filetype='Phantom', prefetch=1, columns=None,
+               reuse_buffer=False):
+    """Iterate over dumps, reading the next ones in the background.
+
+    While the current Dump is being processed, the next `prefetch` dumps
+    are read by worker processes, which hides most of the time spent
+    waiting on the disk.
+
+    Parameters
+    ----------
+    paths
+        A list of paths to dump files.
+    filetype
+        The format of the files, as for read_data.
+    prefetch
+        Number of dumps read ahead of the one being processed. With
+        prefetch=0 the dumps are read one at a time in this process.
+    columns
+        Optional list of labels to keep, as for read_data.
+    reuse_buffer
+        If True, every Dump yielded shares a single data buffer, so peak
+        memory does not grow with the number of dumps. The data of a Dump
+        is then overwritten when the next one is yielded, so copy anything
+        that needs to be kept.
+
+    Yields
+    ------
+    Dump
+        One Dump per path, in the order given.
+    """
+
+    paths = [str(path) for path in paths]
+
+    for path in paths:
+        if not os.path.exists(path):
+            raise FileNotFoundError("filepath " + path + " does not exist.")
+
+    if prefetch < 1:
+        yield from _iter_dumps_serial(paths, filetype, columns, reuse_buffer)
+    else:
+        yield from _iter_dumps_prefetch(paths, filetype, prefetch, columns, reuse_buffer)
+
+
+def _iter_dumps_prefetch(paths, filetype, prefetch, columns, reuse_buffer):
+    """ iter_dumps with prefetch >= 1, reading dumps in worker processes. """
+    buffer = None
+
+    if shared_memory is not None:
+        # See read_many
+        resource_tracker.ensure_running()
+
+    paths = iter(paths)
+    pending = deque()
+
+    with ProcessPoolExecutor(max_workers=prefetch) as executor:
+        try:
+            for path in paths:
+                pending.append(executor.submit(_read_shared, path, filetype, columns))
+                if len(pending) == prefetch:
+                    break
+
+            while len(pending) > 0:
+                result = pending.popleft().result()
+
+                # Start reading the next dump before handing this one over
+                path = next(paths, None)
+                if path is not None:
+                    pending.append(executor.submit(_read_shared, path, filetype, columns))
+
+                if reuse_buffer and not isinstance(result, Dump):
+                    shape = result[1]
+                    buffer = _grow_buffer(buffer, shape[0] * shape[1])
+                    yield _dump_from_shared(result, out=buffer)
+                else:
+                    yield _dump_from_shared(result)
+        finally:
+            # Release dumps that were read ahead but never yielded, e.g. if
+            # the loop over the iterator was stopped early
+            _discard_shared(list(pending))
+
+
+def _iter_dumps_serial(paths, filetype, columns, reuse_buffer):
+    """ iter_dumps with prefetch=0, reading each dump in this process. """
+    buffer = None
+
+    for path in paths:
+        if not reuse_buffer:
+            yield read_data_binary(path, filetype=filetype, columns=columns)
+            continue
+
+        ncol, npart = _read_header(path.encode('utf-8'),
+                                   filetype.encode('utf-8'), c_int(0))
+        buffer = _grow_buffer(buffer, ncol.value * npart.value)
+
+        yield read_data_binary(path, filetype=filetype,
+                               ncol=ncol.value, npart=npart.value,
+                               out=buffer, columns=columns)
+
+
+def _grow_buffer(buffer, size):
+    """ Return buffer if it holds at least size values, or a larger one. """
+    if buffer is None or buffer.size < size:
+        buffer = np.empty(size, dtype=np.float64)
+    return buffer
+
+
+def _read_shared(filepath, filetype, columns):
+    """ Read a dump into shared memory. Runs in a worker process.
+
+    Returns the name of the shared memory block along with everything
+    needed to rebuild the Dump in the parent process. Falls back to
+    returning the Dump itself if shared memory is not available.
+    """
+
+    if shared_memory is None:
+        return read_data_binary(filepath, filetype=filetype, columns=columns)
+
+    ncol, npart = _read_header(filepath.encode('utf-8'),
+                               filetype.encode('utf-8'), c_int(0))
+
+    size = ncol.value * npart.value
+    shm = shared_memory.SharedMemory(create=True, size=max(8 * size, 1))
+
+    try:
+        buffer = np.ndarray((size,), dtype=np.float64, buffer=shm.buf)
+        dump = read_data_binary(filepath, filetype=filetype,
+                                ncol=ncol.value, npart=npart.value,
+                                out=buffer, columns=columns)
+
+        result = (shm.name, dump.data.shape, dump.labels, dump.headers,
+                  dump.filepath, dump.filetype)
+
+        # Release every view of the shared memory so it can be closed
+        del buffer, dump
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+
+    shm.close()
+
+    return result
+
+
+def _dump_from_shared(result, out=None):
+    """ Build a Dump in the parent process from the result of _read_shared.
+
+    The data is copied into out if it is given, as for read_data.
+    """
+
+    if isinstance(result, Dump):
+        return result
+
+    name, shape, labels, headers, filepath, filetype = result
+
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        shared = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        if out is None:
+            data = shared.copy()
+        else:
+            data = _output_buffer(out, *shape)
+            data[...] = shared
+        del shared
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return Dump(data=data, labels=labels, headers=headers,
+                filepath=filepath, filetype=filetype)
+
+
+def _discard_shared(futures):
+    """ Unlink the shared memory of results that will not be collected. """
+
+    for future in futures:
+        future.cancel()
+
+    wait(futures)
+
+    for future in futures:
+        if future.cancelled() or future.exception() is not None:
+            continue
+
+        result = future.result()
+        if isinstance(result, Dump):
+            continue
+
+        try:
+            shm = shared_memory.SharedMemory(name=result[0])
+        except FileNotFoundError:
+            # Already released by _dump_from_shared
+            continue
+        shm.close()
+        shm.unlink()
+
+
 def get_labels(ncol):
     if type(ncol) is c_int:
         ncol_py = ncol.value
@@ -4,6 +4,7 @@ A utils directory
 """
 
 
-from .utils import stdchannel_redirected
+from .utils import stdchannel_redirected, set_capture
+from .tree import KDTree
 
-__all__ = ['stdchannel_redirected']
+__all__ = ['stdchannel_redirected', 'set_capture', 'KDTree']
@@ -0,0 +1,255 @@
+"""
+A k-d tree over the particles of a dump.
+
+The tree is built with whole-array numpy operations, one level at a time,
+and is queried the same way, so culling the particles in a region only
+touches the leaves that overlap it.
+"""
+
+import hashlib
+
+import numpy as np
+
+
+class KDTree:
+    """k-d tree of particle positions, for culling and neighbour queries.
+
+    Every node is split at the median of its particles along the axis in
+    which they are most spread out, down to leaves of between leafsize and
+    2*leafsize particles. Each node stores the bounding box of its
+    particles, including their kernels when smoothing lengths are given.
+
+    Parameters
+    ----------
+    positions
+        Array of shape (ndim, npart) of particle positions.
+    h
+        Optional smoothing lengths. With them, queries with smoothing=True
+        return the particles whose kernel, of radius radkern*h, overlaps
+        the region.
+    leafsize
+        Minimum number of particles in a leaf.
+    radkern
+        Radius of the kernel in units of h.
+    labels
+        Optional names of the axes, e.g. ['x', 'y', 'z'].
+    """
+
+    def __init__(self, positions, h=None, leafsize=32, radkern=2., labels=None):
+        positions = np.asarray(positions, dtype=np.float64)
+        if positions.ndim != 2:
+            raise ValueError("positions must have shape (ndim, npart).")
+
+        if leafsize < 1:
+            raise ValueError("leafsize must be at least 1.")
+
+        npart = positions.shape[1]
+
+        self.leafsize = leafsize
+        self.radkern = radkern
+        self.labels = None if labels is None else list(labels)
+        self.nlevels = int(np.floor(np.log2(npart / leafsize))) if npart > leafsize else 0
+
+        # The particles sorted along each axis. These are split stably at
+        # every level, so within each node they stay sorted along each axis.
+        orders = [np.argsort(coord, kind='stable') for coord in positions]
+
+        for level in range(self.nlevels):
+            bounds = self._bounds(level, npart)
+            first, last = bounds[:-1], bounds[1:] - 1
+
+            extent = [coord[order[last]] - coord[order[first]]
+                      for coord, order in zip(positions, orders)]
+            axis = np.argmax(extent, axis=0)
+
+            # The first half of each node along its split axis goes left
+            childbounds = self._bounds(level + 1, npart)
+            child = np.repeat(np.arange(len(childbounds) - 1), np.diff(childbounds))
+            node = child // 2
+            split = np.choose(axis[node], orders)
+            left = np.empty(npart, dtype=bool)
+            left[split] = child % 2 == 0
+
+            orders = [order[np.argsort(2 * node + ~left[order], kind='stable')]
+                      for order in orders]
+
+        order = orders[0] if len(orders) > 0 else np.arange(npart)
+
+        self._set_particles(order, positions, h)
+        self._set_boxes()
+
+    @staticmethod
+    def _bounds(level, npart):
+        """ First particle of each node of a level, and npart. """
+        nnodes = 2**level
+        return (np.arange(nnodes + 1) * npart) // nnodes
+
+    def _set_particles(self, index, positions, h):
+        self.index = index
+        self.npart = len(index)
+
+        # Position of each particle in the tree order
+        self.rank = np.empty_like(index)
+        self.rank[index] = np.arange(self.npart)
+
+        # Keep the particles in tree order, so each leaf is contiguous
+        self.positions = np.ascontiguousarray(positions[:, index])
+        if h is None:
+            self.radius = np.zeros(self.npart)
+        else:
+            # Accreted particles have h < 0, but still take up a kernel
+            self.radius = self.radkern * np.abs(np.asarray(h, dtype=np.float64)[index])
+
+    def _set_boxes(self):
+        """ Bounding boxes of every node, from the leaves upwards. """
+        nnodes = 2**(self.nlevels + 1) - 1
+        ndim = len(self.positions)
+        self.lo = np.full((ndim, nnodes), np.inf)
+        self.hi = np.full((ndim, nnodes), -np.inf)
+
+        if self.npart == 0:
+            return
+
+        bounds = self._bounds(self.nlevels, self.npart)
+        first = 2**self.nlevels - 1
+        self.lo[:, first:] = np.minimum.reduceat(self.positions - self.radius, bounds[:-1], axis=1)
+        self.hi[:, first:] = np.maximum.reduceat(self.positions + self.radius, bounds[:-1], axis=1)
+
+        for level in range(self.nlevels - 1, -1, -1):
+            nodes = np.arange(2**level - 1, 2**(level + 1) - 1)
+            self.lo[:, nodes] = np.minimum(self.lo[:, 2 * nodes + 1], self.lo[:, 2 * nodes + 2])
+            self.hi[:, nodes] = np.maximum(self.hi[:, 2 * nodes + 1], self.hi[:, 2 * nodes + 2])
+
+    def _query(self, node_test, particle_test):
+        """ Indices of the particles passing particle_test, in the leaves
+        that pass node_test.
+        """
+        if self.npart == 0:
+            return np.array([], dtype=np.intp)
+
+        nodes = np.array([0])
+        for level in range(self.nlevels + 1):
+            nodes = nodes[node_test(self.lo[:, nodes], self.hi[:, nodes])]
+            if level < self.nlevels:
+                nodes = np.stack([2 * nodes + 1, 2 * nodes + 2], axis=1).ravel()
+
+        bounds = self._bounds(self.nlevels, self.npart)
+        leaves = nodes - (2**self.nlevels - 1)
+        starts = bounds[leaves]
+        lengths = bounds[leaves + 1] - starts
+
+        # Particles in tree order of all the leaves, joined together
+        offsets = np.cumsum(lengths) - lengths
+        candidates = np.arange(lengths.sum()) + np.repeat(starts - offsets, lengths)
+
+        keep = particle_test(self.positions[:, candidates], self.radius[candidates])
+
+        return np.sort(self.index[candidates[keep]])
+
+    def box(self, lo, hi, smoothing=True):
+        """Indices of the particles inside a box.
+
+        Parameters
+        ----------
+        lo, hi
+            The corners of the box, with one value per dimension. Use
+            -inf and inf to leave an axis unbounded.
+        smoothing
+            If True, return the particles whose kernel overlaps the box,
+            otherwise only those whose position is inside it.
+        """
+        lo = np.asarray(lo, dtype=np.float64)[:, None]
+        hi = np.asarray(hi, dtype=np.float64)[:, None]
+
+        def node_test(nodelo, nodehi):
+            return np.all((nodelo <= hi) & (nodehi >= lo), axis=0)
+
+        def particle_test(positions, radius):
+            if not smoothing:
+                radius = 0.
+            return np.all((positions - radius <= hi) & (positions + radius >= lo), axis=0)
+
+        return self._query(node_test, particle_test)
+
+    def slab(self, axis, lo, hi, smoothing=True):
+        """ Indices of the particles with lo <= position[axis] <= hi, as for box. """
+        boxlo = np.full(len(self.positions), -np.inf)
+        boxhi = np.full(len(self.positions), np.inf)
+        boxlo[axis] = lo
+        boxhi[axis] = hi
+        return self.box(boxlo, boxhi, smoothing=smoothing)
+
+    def sphere(self, centre, radius, smoothing=False):
+        """Indices of the particles within radius of centre.
+
+        If smoothing is True, the particles whose kernel overlaps the
+        sphere are returned instead.
+        """
+        centre = np.asarray(centre, dtype=np.float64)[:, None]
+
+        def node_test(nodelo, nodehi):
+            nearest = np.clip(centre, nodelo, nodehi)
+            return np.sum((nearest - centre)**2, axis=0) <= radius**2
+
+        def particle_test(positions, kernel):
+            reach = radius + kernel if smoothing else radius
+            return np.sum((positions - centre)**2, axis=0) <= reach**2
+
+        return self._query(node_test, particle_test)
+
+    def neighbours(self, i):
+        """ Indices of the particles within radkern*h of particle i, including i. """
+        if np.all(self.radius == 0.):
+            raise ValueError("The tree was built without smoothing lengths.")
+
+        rank = self.rank[i]
+        return self.sphere(self.positions[:, rank], self.radius[rank])
+
+    def _checksum(self):
+        """ Hash of the particle positions and kernel radii, in tree order. """
+        checksum = hashlib.sha1(np.ascontiguousarray(self.positions).data)
+        checksum.update(np.ascontiguousarray(self.radius).data)
+        return checksum.hexdigest()
+
+    def to_hdf5(self, group):
+        """ Store the tree in an h5py Group, so it can be reloaded with from_hdf5. """
+        group.attrs['checksum'] = self._checksum()
+        group.attrs['leafsize'] = self.leafsize
+        group.attrs['radkern'] = self.radkern
+        group.attrs['nlevels'] = self.nlevels
+        if self.labels is not None:
+            group.attrs['labels'] = self.labels
+        group.create_dataset('index', data=self.index)
+        group.create_dataset('lo', data=self.lo)
+        group.create_dataset('hi', data=self.hi)
+
+    @classmethod
+    def from_hdf5(cls, group, positions, h=None):
+        """Load a tree stored with to_hdf5, without building it again.
+
+        positions and h must be those the tree was built with, in the same
+        order. A ValueError is raised if they are not.
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        index = group['index'][()]
+
+        if len(index) != positions.shape[1]:
+            raise ValueError("The stored tree has " + str(len(index)) + " particles, "
+                             "but positions has " + str(positions.shape[1]) + ".")
+
+        tree = cls.__new__(cls)
+        tree.leafsize = int(group.attrs['leafsize'])
+        tree.radkern = float(group.attrs['radkern'])
+        tree.nlevels = int(group.attrs['nlevels'])
+        tree.labels = [str(label) for label in group.attrs['labels']] \
+            if 'labels' in group.attrs else None
+        tree._set_particles(index, positions, h)
+
+        if 'checksum' in group.attrs and group.attrs['checksum'] != tree._checksum():
+            raise ValueError("The stored tree was built for different positions "
+                             "or smoothing lengths.")
+
+        tree.lo = group['lo'][()]
+        tree.hi = group['hi'][()]
+
+        return tree
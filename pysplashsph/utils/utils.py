@@ -1,37 +1,128 @@
+import io
 import os
 import sys
 from contextlib import contextmanager
 import tempfile
+import threading
 import warnings
 
 
+def _capture_memfd():
+    """ Capture into an anonymous in-memory file (Linux only). """
+    fd = os.memfd_create('pysplashsph_stdout')
+
+    def read():
+        os.lseek(fd, 0, os.SEEK_SET)
+        with os.fdopen(fd, 'rb') as f:
+            return f.read()
+
+    return fd, read
+
+
+def _capture_pipe():
+    """ Capture into a pipe that is emptied by a reader thread. """
+    read_fd, write_fd = os.pipe()
+    chunks = []
+
+    def drain():
+        with os.fdopen(read_fd, 'rb') as f:
+            chunks.append(f.read())
+
+    thread = threading.Thread(target=drain, daemon=True)
+    thread.start()
+
+    def read():
+        # Closing the write end lets the reader thread see the end of file
+        os.close(write_fd)
+        thread.join()
+        return b''.join(chunks)
+
+    return write_fd, read
+
+
+def _capture_tempfile():
+    """ Capture into an unnamed temporary file. """
+    dest_file = tempfile.TemporaryFile()
+
+    def read():
+        try:
+            dest_file.seek(0)
+            return dest_file.read()
+        finally:
+            dest_file.close()
+
+    return dest_file.fileno(), read
+
+
+_capture_backends = {'memfd': _capture_memfd,
+                     'pipe': _capture_pipe,
+                     'tempfile': _capture_tempfile}
+
+# memfd_create needs Linux and Python 3.8
+_capture = 'memfd' if hasattr(os, 'memfd_create') else 'tempfile'
+
+
+def set_capture(backend):
+    """
+    Set how stdout from Fortran code is captured by stdchannel_redirected.
+
+    backend is one of 'memfd', 'pipe', 'tempfile', or None to not capture
+    the output at all. Without capturing, SPLASH prints straight to the
+    terminal and its output is not checked for errors.
+    """
+    global _capture
+
+    if backend is not None and backend not in _capture_backends:
+        raise ValueError("Unknown capture backend " + str(backend) + ". "
+                         "Use one of " + str(list(_capture_backends)) + " or None.")
+
+    if backend == 'memfd' and not hasattr(os, 'memfd_create'):
+        raise ValueError("The memfd capture backend is not available on this system.")
+
+    _capture = backend
+
+
 @contextmanager
-def stdchannel_redirected(print_warnings=False, stdchannel=sys.stdout):
+def stdchannel_redirected(print_warnings=False, stdchannel=sys.stdout,
+                          capture='default'):
     """
-    Redirect stdout from Fortran code into a temporary file, so to not clutter
-    the terminal with unnecessary print statements.
+    Redirect stdout from Fortran code into a buffer, so to not clutter
+    the terminal with unnecessary print statements. The buffer is checked
+    for warnings and errors once the Fortran code has finished.
+
+    capture selects the backend, as for set_capture. By default the one
+    chosen with set_capture is used.
     """
 
-    # Create a temporary file to store stdout from Fortran code
-    dest_file = tempfile.NamedTemporaryFile(mode='w')
+    if capture == 'default':
+        capture = _capture
 
-    try:
-        oldstdchannel = os.dup(stdchannel.fileno())
+    if capture is None:
+        yield
+        return
+
+    # Make sure output already printed from Python is not captured
+    stdchannel.flush()
 
-        # Redirect stdchannel messages into our temporary file
-        os.dup2(dest_file.fileno(), stdchannel.fileno())
+    capture_fd, read_capture = _capture_backends[capture]()
+
+    oldstdchannel = os.dup(stdchannel.fileno())
+
+    try:
+        # Redirect stdchannel messages into our buffer
+        os.dup2(capture_fd, stdchannel.fileno())
 
         # Allow Fortran code to run
         yield
 
     finally:
-        if oldstdchannel is not None:
-            os.dup2(oldstdchannel, stdchannel.fileno())
-        if dest_file is not None:
-            with open(dest_file.name, 'r') as f:
-                # Check the output for errors
-                stdchannel_check_errors(f, print_warnings=print_warnings)
-            dest_file.close()
+        os.dup2(oldstdchannel, stdchannel.fileno())
+        os.close(oldstdchannel)
+
+        output = read_capture().decode('utf-8', errors='replace')
+
+        # Check the output for errors
+        stdchannel_check_errors(io.StringIO(output), print_warnings=print_warnings)
 
 
 def stdchannel_check_errors(fileobject, print_warnings=False):
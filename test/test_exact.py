@@ -5,3 +5,51 @@ def test_shock(capfd):
   x = np.linspace(0, 1, 10)
   y = pysplashsph.exact.shock(x)
   capfd.readouterr()  # capture OS level output, so that it can be silenced with "pytest -s"
+
+def test_shock_out(capfd):
+  x = np.linspace(0, 1, 10)
+  y = pysplashsph.exact.shock(x)
+
+  # Any shape of input is allowed, and the result can be written into out
+  out = np.empty((2, 5))
+  y_out = pysplashsph.exact.shock(x.reshape(2, 5), out=out)
+  capfd.readouterr()
+
+  assert y_out is out
+  assert np.array_equal(y_out.ravel(), y)
+
+def test_shock_multiple(capfd):
+  x = np.linspace(0, 1, 10)
+  plots = ['density', 'pressure', 'velocity']
+  y = pysplashsph.exact.shock(x, plot=plots)
+  capfd.readouterr()
+
+  assert list(y) == plots
+  for plot in plots:
+    assert np.array_equal(y[plot], pysplashsph.exact.shock(x, plot=plot))
+  capfd.readouterr()
+
+def test_shock_cache(capfd, tmp_path):
+  x = np.linspace(0, 1, 10)
+  pysplashsph.exact.enable_cache(maxsize=4, cachedir=str(tmp_path))
+  try:
+    y = pysplashsph.exact.shock(x)
+    y_cached = pysplashsph.exact.shock(x)
+    info = pysplashsph.exact.cache_info()
+  finally:
+    pysplashsph.exact.disable_cache()
+  capfd.readouterr()
+
+  assert np.array_equal(y, y_cached)
+  assert info.hits == 1 and info.misses == 1
+
+def test_shock_times(capfd):
+  x = np.linspace(0, 1, 10)
+  times = [0.1, 0.2, 0.3]
+  y = pysplashsph.exact.shock(x, time=times)
+  capfd.readouterr()
+
+  assert y.shape == (len(times), len(x))
+  for i, time in enumerate(times):
+    assert np.array_equal(y[i], pysplashsph.exact.shock(x, time=time))
+  capfd.readouterr()
@@ -0,0 +1,299 @@
+import pysplashsph
+import pytest
+import numpy as np
+import warnings
+from pysplashsph.read.read import Dump
+
+
+def make_dump(npart=2000, hfact=1.2, seed=1):
+    """ A blob of equal mass particles, with smoothing lengths that vary. """
+    rng = np.random.default_rng(seed)
+    xyz = rng.normal(scale=0.3, size=(3, npart))
+    h = 0.05 * (1. + rng.random(npart))
+    itype = np.ones(npart)
+
+    return Dump(data=np.vstack([xyz, h, itype]),
+                labels=['x', 'y', 'z', 'h', 'itype'],
+                headers={'hfact': hfact, 'massoftype': 1. / npart})
+
+
+@pytest.mark.parametrize('kernel', ['cubic', 'quintic', 'wendland2',
+                                    'wendland4', 'wendland6'])
+def test_projection_mass(kernel):
+
+    dump = make_dump()
+    npix = 128
+    image = pysplashsph.interpolation.interpolate3d_projection(
+        dump, npixx=npix, xlim=(-2, 2), ylim=(-2, 2), kernel=kernel)
+
+    assert image.shape == (npix, npix)
+
+    # The column density integrated over the image is the total mass
+    pixarea = (4. / npix)**2
+    assert np.isclose(image.sum() * pixarea, 1., rtol=1e-3)
+
+
+def test_projection_accreted():
+
+    # Accreted particles have h < 0, and are left out of the image
+    dump = make_dump()
+    dump['h'] = np.where(np.arange(2000) % 2 == 0, -1., 1.) * dump['h']
+    npix = 128
+    image = pysplashsph.interpolation.interpolate3d_projection(
+        dump, npixx=npix, xlim=(-2, 2), ylim=(-2, 2))
+
+    assert np.isclose(image.sum() * (4. / npix)**2, 0.5, rtol=1e-3)
+
+
+def test_projection_normalise():
+
+    dump = make_dump()
+    image = pysplashsph.interpolation.interpolate3d_projection(
+        dump, quantity=np.full(2000, 3.), npixx=32, npixy=16,
+        xlim=(-1, 1), ylim=(-0.5, 0.5), normalise=True)
+
+    assert image.shape == (16, 32)
+    assert np.allclose(image[image > 0], 3.)
+
+
+def test_projection_many():
+
+    dump = make_dump()
+    quantities = ['density', 'x', dump['z']**2]
+
+    for render, kwargs in [(pysplashsph.interpolation.interpolate3d_projection, {}),
+                           (pysplashsph.interpolation.interpolate3d_fastxsec,
+                            {'zslice': 0.1})]:
+        images = render(dump, quantity=quantities, npixx=32, xlim=(-1, 1),
+                        ylim=(-1, 1), normalise=True, **kwargs)
+
+        assert list(images) == ['density', 'x', 2]
+        for name, quantity in zip(images, quantities):
+            image = render(dump, quantity=quantity, npixx=32, xlim=(-1, 1),
+                           ylim=(-1, 1), normalise=True, **kwargs)
+            assert np.allclose(images[name], image)
+
+
+def make_lattice(n=20, hfact=1.2):
+    """ A cubic lattice of particles with unit density in the unit cube. """
+    dx = 1. / n
+    grid = (np.arange(n) + 0.5) * dx
+    xyz = np.array(np.meshgrid(grid, grid, grid, indexing='ij')).reshape(3, -1)
+    npart = xyz.shape[1]
+
+    return Dump(data=np.vstack([xyz, np.full(npart, hfact * dx), np.ones(npart)]),
+                labels=['x', 'y', 'z', 'h', 'itype'],
+                headers={'hfact': hfact, 'massoftype': 1. / npart})
+
+
+@pytest.mark.parametrize('kernel', ['cubic', 'quintic', 'wendland2',
+                                    'wendland4', 'wendland6'])
+def test_kernel_normalisation(kernel):
+
+    kernel = pysplashsph.interpolation.get_kernel(kernel)
+    q = np.linspace(0., kernel.radkern, 10001)
+
+    def integrate(f):
+        return 0.5 * np.sum(f[1:] + f[:-1]) * (q[1] - q[0])
+
+    assert np.isclose(integrate(4. * np.pi * q**2 * kernel.w(q**2)), 1., rtol=1e-4)
+    assert np.isclose(integrate(2. * np.pi * q * kernel.column(q**2)), 1., rtol=1e-4)
+
+
+def test_fastxsec():
+
+    dump = make_lattice()
+    image = pysplashsph.interpolation.interpolate3d_fastxsec(
+        dump, zslice=0.5, npixx=100, xlim=(0, 1), ylim=(0, 1),
+        tilesize=32, workers=4)
+
+    assert image.shape == (100, 100)
+    assert np.allclose(image[25:75, 25:75], 1., rtol=1e-2)
+
+    # Tiles must join up to the same image as a single tile
+    single = pysplashsph.interpolation.interpolate3d_fastxsec(
+        dump, zslice=0.5, npixx=100, xlim=(0, 1), ylim=(0, 1),
+        tilesize=100, workers=1)
+
+    assert np.allclose(image, single)
+
+
+def test_vec():
+
+    dump = make_lattice()
+    npart = len(dump['x'])
+    vector = (np.full(npart, 2.), np.full(npart, -1.))
+
+    proj = pysplashsph.interpolation.interpolate3d_proj_vec(
+        dump, vector=vector, npixx=50, xlim=(0, 1), ylim=(0, 1))
+    xsec = pysplashsph.interpolation.interpolate3d_xsec_vec(
+        dump, vector=vector, zslice=0.5, npixx=50, xlim=(0, 1), ylim=(0, 1))
+
+    for image in [proj, xsec]:
+        assert image.shape == (2, 50, 50)
+        assert np.allclose(image[0, 10:40, 10:40], 2.)
+        assert np.allclose(image[1, 10:40, 10:40], -1.)
+
+
+def test_vec_splash_labels():
+
+    # SPLASH labels velocities v_x, v_y and v_z, which the 'v' prefix finds
+    dump = make_lattice()
+    npart = len(dump['x'])
+    dump = Dump(data=np.vstack([dump.data, np.full(npart, 2.), np.full(npart, -1.)]),
+                labels=dump.labels + ['v_x', 'v_y'], headers=dump.headers)
+
+    image = pysplashsph.interpolation.interpolate3d_proj_vec(
+        dump, npixx=50, xlim=(0, 1), ylim=(0, 1))
+
+    assert np.allclose(image[0, 10:40, 10:40], 2.)
+    assert np.allclose(image[1, 10:40, 10:40], -1.)
+
+
+def test_vec_accreted():
+
+    dump = make_dump()
+    accreted = np.arange(2000) % 2 == 0
+    dump['h'] = np.where(accreted, -1., 1.) * dump['h']
+    kept = Dump(data=dump.data[:, ~accreted], labels=dump.labels, headers=dump.headers)
+
+    images = [pysplashsph.interpolation.interpolate3d_proj_vec(d, vector=(d['x'], d['y']),
+                                                               npixx=32, xlim=(-1, 1),
+                                                               ylim=(-1, 1), normalise=False)
+              for d in [dump, kept]]
+
+    assert np.allclose(images[0], images[1])
+
+
+def test_proj_opacity():
+
+    dump = make_dump()
+    limits = dict(npixx=64, xlim=(-1, 1), ylim=(-1, 1))
+
+    # An optically thin render is the column density times kappa
+    kappa = 1e-8
+    thin = pysplashsph.interpolation.interp3d_proj_opacity(
+        dump, quantity=np.ones(2000), kappa=kappa, **limits)
+    column = pysplashsph.interpolation.interpolate3d_projection(dump, **limits)
+
+    assert np.allclose(thin / kappa, column, rtol=1e-6, atol=1e-8)
+
+    # An opaque render of a constant is that constant
+    opaque = pysplashsph.interpolation.interp3d_proj_opacity(
+        dump, quantity=np.full(2000, 3.), taupartdepth=100., **limits)
+
+    assert np.allclose(opaque[28:36, 28:36], 3.)
+
+
+def test_proj_opacity_accreted():
+
+    dump = make_dump()
+    dump['h'] = np.where(np.arange(2000) % 2 == 0, -1., 1.) * dump['h']
+    npix = 64
+
+    kappa = 1e-8
+    thin = pysplashsph.interpolation.interp3d_proj_opacity(
+        dump, quantity=np.ones(2000), kappa=kappa, npixx=npix, xlim=(-2, 2), ylim=(-2, 2))
+
+    assert np.isclose(thin.sum() / kappa * (4. / npix)**2, 0.5, rtol=1e-3)
+
+    # With every particle accreted the image is empty, without warnings
+    dump['h'] = -np.abs(dump['h'])
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        image = pysplashsph.interpolation.interp3d_proj_opacity(
+            dump, npixx=npix, xlim=(-2, 2), ylim=(-2, 2))
+
+    assert image.shape == (npix, npix)
+    assert np.all(image == 0.)
+
+
+def test_geom():
+
+    dump = make_lattice(n=30)
+    # Centre the lattice on the origin
+    dump.data[:3] -= 0.5
+
+    npixx, npixy = 20, 32
+    r = (np.arange(npixx) + 0.5) * 0.3 / npixx
+    phi = -np.pi + (np.arange(npixy) + 0.5) * 2. * np.pi / npixy
+
+    xsec = pysplashsph.interpolation.interpolate3D_xsec_geom(
+        dump, quantity='x', geometry='cylindrical', x='r', y='phi', zslice=0.,
+        npixx=npixx, npixy=npixy, xlim=(0, 0.3), normalise=True)
+
+    assert xsec.shape == (npixy, npixx)
+    assert np.allclose(xsec, r[None, :] * np.cos(phi)[:, None], atol=1e-3)
+
+    # Unit density, so the surface density of a unit column is 1
+    proj = pysplashsph.interpolation.interpolate3D_proj_geom(
+        dump, npixx=npixx, npixy=npixy, xlim=(0, 0.3))
+
+    assert np.allclose(proj, 1., rtol=1e-2)
+
+
+def test_pyramid():
+
+    dump = make_dump()
+    pyramid = pysplashsph.interpolation.ImagePyramid(
+        dump, xlim=(-2, 2), ylim=(-2, 2), tilesize=32)
+
+    # The pyramid only uses a tree that has already been built
+    assert not dump.has_tree
+
+    # The coarsest tile still holds all the mass
+    tile = pyramid.tile(0, 0, 0)
+    assert tile.shape == (32, 32)
+    assert np.isclose(tile.sum() * (4. / 32)**2, 1., rtol=1e-2)
+
+    # A view renders only the tiles it overlaps
+    image, extent = pyramid.view((0., 0.5), (0., 0.25), npixx=64)
+    level = pyramid.level_for(0.5 / 64)
+
+    assert extent[0] <= 0. and extent[1] >= 0.5
+    assert all(key[0] in (0, level) for key in pyramid._tiles)
+
+    expected = pysplashsph.interpolation.interpolate3d_projection(
+        dump, npixx=image.shape[1], npixy=image.shape[0],
+        xlim=extent[:2], ylim=extent[2:])
+    assert np.allclose(image, expected)
+
+    dump.tree
+    culled = pysplashsph.interpolation.ImagePyramid(
+        dump, xlim=(-2, 2), ylim=(-2, 2), tilesize=32)
+    assert culled._tree is dump.tree
+    assert np.allclose(culled.view((0., 0.5), (0., 0.25), npixx=64)[0], image)
+
+
+def test_pyramid_accreted():
+
+    dump = make_dump()
+    accreted = np.arange(2000) % 2 == 0
+    dump['h'] = np.where(accreted, -1., 1.) * dump['h']
+    kept = Dump(data=dump.data[:, ~accreted], labels=dump.labels, headers=dump.headers)
+
+    tiles = [pysplashsph.interpolation.ImagePyramid(d, xlim=(-2, 2), ylim=(-2, 2),
+                                                    tilesize=32).tile(0, 0, 0)
+             for d in [dump, kept]]
+
+    assert np.allclose(tiles[0], tiles[1])
+
+
+def test_grid(tmp_path):
+
+    dump = make_lattice()
+    bounds = ((0, 1), (0, 1), (0, 1))
+
+    grid = pysplashsph.interpolation.interpolate3d_grid(
+        dump, shape=(20, 24, 28), bounds=bounds, chunksize=3)
+
+    assert grid.shape == (20, 24, 28)
+    assert np.allclose(grid[5:15, 6:18, 7:21], 1., rtol=1e-2)
+
+    # Writing slabs into a memmap gives the same grid
+    out = np.memmap(tmp_path / 'grid.dat', dtype=np.float64, mode='w+',
+                    shape=(20, 24, 28))
+    pysplashsph.interpolation.interpolate3d_grid(
+        dump, shape=(20, 24, 28), bounds=bounds, out=out)
+
+    assert np.allclose(out, grid)
@@ -1,6 +1,7 @@
 import pysplashsph
 import numpy as np
 import os
+import pytest
 
 test_dir = os.path.dirname(os.path.realpath(__file__))
 test_file_ascii  = os.path.join(test_dir, 'data/test_00000.ascii')
@@ -32,3 +33,234 @@ def test_read(capfd):
         print(sph_data_from_ascii[w])
 
     assert success, 'Binary data does not match ascii data.'
+
+
+def test_read_into_buffer(capfd):
+
+    dump = pysplashsph.read.read_data(test_file_binary, filetype='Phantom')
+
+    # A buffer larger than needed can be reused between dumps
+    buffer = np.empty(dump.data.size + 100)
+    dump_buffered = pysplashsph.read.read_data(test_file_binary, filetype='Phantom',
+                                               out=buffer)
+
+    capfd.readouterr()
+
+    assert np.shares_memory(dump_buffered.data, buffer)
+    assert np.array_equal(dump.data, dump_buffered.data)
+
+
+def test_read_columns(capfd):
+
+    dump = pysplashsph.read.read_data(test_file_binary, filetype='Phantom')
+    dump_xyz = pysplashsph.read.read_data(test_file_binary, filetype='Phantom',
+                                          columns=['x', 'y', 'z'])
+
+    capfd.readouterr()
+
+    assert dump_xyz.labels == ['x', 'y', 'z']
+    assert dump_xyz.data.shape == (3, dump.data.shape[1])
+    for label in dump_xyz.labels:
+        assert np.array_equal(dump_xyz[label], dump[label])
+
+
+def test_scan_headers(capfd):
+
+    dump = pysplashsph.read.read_data(test_file_binary, filetype='Phantom')
+    headers = pysplashsph.read.scan_headers([test_file_binary], filetype='Phantom')
+
+    capfd.readouterr()
+
+    assert len(headers) == 1
+    assert (headers[0]['ncol'], headers[0]['npart']) == dump.data.shape
+    assert headers[0]['labels'] == dump.labels
+
+
+def test_read_many(capfd):
+
+    dump = pysplashsph.read.read_data(test_file_binary, filetype='Phantom')
+    dumps = pysplashsph.read.read_many([test_file_binary, test_file_binary],
+                                       filetype='Phantom', workers=2)
+
+    capfd.readouterr()
+
+    assert len(dumps) == 2
+    for dump_many in dumps:
+        assert dump_many.labels == dump.labels
+        assert np.array_equal(dump_many.data, dump.data)
+
+
+def test_iter_dumps(capfd):
+
+    dump = pysplashsph.read.read_data(test_file_binary, filetype='Phantom')
+
+    for prefetch in [0, 2]:
+        dumps = pysplashsph.read.iter_dumps([test_file_binary] * 3, filetype='Phantom',
+                                            prefetch=prefetch, reuse_buffer=True)
+        for dump_iter in dumps:
+            assert np.array_equal(dump_iter.data, dump.data)
+
+    capfd.readouterr()
+
+
+def test_dump_columns(capfd):
+
+    dump = pysplashsph.read.read_data(test_file_binary, filetype='Phantom')
+
+    capfd.readouterr()
+
+    for col, label in enumerate(dump.labels):
+        assert np.shares_memory(dump[label], dump.data[col])
+
+    # Derived quantities are computed once and kept
+    assert dump['density'] is dump['density']
+    assert np.allclose(dump['rho'], dump['density'])
+
+    # Replacing the data drops the views and derived quantities
+    dump.data = dump.data.copy()
+    assert np.shares_memory(dump['h'], dump.data)
+
+
+def test_derived_quantities():
+
+    rng = np.random.default_rng(1)
+    data = rng.random((8, 100))
+    dump = pysplashsph.read.read.Dump(
+        data=data, labels=['x', 'y', 'z', 'h', 'vx', 'vy', 'vz', 'u'],
+        headers={'hfact': 1.2, 'massoftype': 0.01, 'udist': 1., 'utime': 1.})
+
+    assert np.allclose(dump['rho'], 0.01 * (1.2 / data[3])**3)
+    assert np.allclose(dump['R'], np.hypot(data[0], data[1]))
+    assert np.allclose(dump['r'], np.sqrt((data[:3]**2).sum(axis=0)))
+    assert np.allclose(dump['vmag'], np.sqrt((data[4:7]**2).sum(axis=0)))
+    assert np.all(dump['temperature'] > 0.)
+
+    # Setting a column drops the quantities computed from it
+    r = dump['r']
+    dump['x'] = 2. * data[0]
+    assert dump['r'] is not r
+    assert np.allclose(dump['R'], np.hypot(data[0], data[1]))
+
+    pysplashsph.read.register_quantity('speed2', lambda dump: dump['vmag']**2)
+    assert np.allclose(dump['speed2'], (data[4:7]**2).sum(axis=0))
+
+    # SPLASH labels the velocity v_x, v_y, v_z, and accreted particles have h < 0
+    dump.labels = ['x', 'y', 'z', 'h', 'v_x', 'v_y', 'v_z', 'u']
+    assert np.allclose(dump['vmag'], np.sqrt((data[4:7]**2).sum(axis=0)))
+
+    density = dump['density']
+    dump['h'] = -data[3]
+    assert np.allclose(dump['density'], density)
+
+
+def test_hdf5_roundtrip(tmp_path):
+
+    rng = np.random.default_rng(1)
+    dump = pysplashsph.read.read.Dump(
+        data=rng.random((5, 1000)), labels=['x', 'y', 'z', 'h', 'u'],
+        headers={'hfact': 1.2, 'massoftype': 0.001}, filetype='ascii')
+    dump.tree
+
+    for compression in [None, 'gzip']:
+        filename = str(tmp_path / ('dump_' + str(compression) + '.h5'))
+        dump.save_hdf5(filename, compression=compression)
+
+        dump_hdf5 = pysplashsph.read.read_hdf5(filename)
+
+        assert dump_hdf5.labels == dump.labels
+        assert dump_hdf5.headers['hfact'] == 1.2
+        for label in dump.labels:
+            assert np.array_equal(dump_hdf5[label], dump[label])
+        assert isinstance(dump_hdf5['x'], np.memmap) == (compression is None)
+
+        # The stored tree is loaded instead of built
+        assert np.array_equal(dump_hdf5.tree.index, dump.tree.index)
+        assert np.array_equal(dump_hdf5.data, dump.data)
+
+
+def test_hdf5_phantom_groups(tmp_path):
+
+    rng = np.random.default_rng(1)
+    data = rng.random((6, 1000))
+    data[5] = rng.choice([1, 2, 3], size=1000, p=[0.6, 0.39, 0.01])
+    dump = pysplashsph.read.read.Dump(
+        data=data, labels=['x', 'y', 'z', 'h', 'u', 'itype'],
+        headers={'hfact': 1.2, 'massoftype': 0.001}, filetype=b'Phantom')
+
+    filename = str(tmp_path / 'dump.h5')
+    dump.save_hdf5(filename)
+
+    # Each type is a contiguous slice, in the original order within it
+    particles = pysplashsph.read.read_hdf5(filename)
+    sinks = pysplashsph.read.read_hdf5(filename, group='sinks')
+    for itype, dump_hdf5, start in [(1, particles, 0),
+                                    (2, particles, np.count_nonzero(data[5] == 1)),
+                                    (3, sinks, 0)]:
+        mask = data[5] == itype
+        end = start + np.count_nonzero(mask)
+        for label in ['x', 'y', 'z', 'h', 'u']:
+            assert np.array_equal(dump_hdf5[label][start:end], dump[label][mask])
+        assert np.all(dump_hdf5['itype'][start:end] == itype)
+
+
+def test_hdf5_phantom_tree(tmp_path):
+
+    rng = np.random.default_rng(2)
+    data = rng.normal(scale=0.3, size=(5, 2000))
+    data[3] = 0.05 * (1. + rng.random(2000))
+    data[4] = rng.choice([1, 2], size=2000)
+    dump = pysplashsph.read.read.Dump(
+        data=data, labels=['x', 'y', 'z', 'h', 'itype'],
+        headers={'hfact': 1.2, 'massoftype': 0.001}, filetype=b'Phantom')
+    dump.tree
+
+    # The particles are written sorted by type, so the stored tree must
+    # follow that order rather than the order of the dump
+    filename = str(tmp_path / 'dump.h5')
+    dump.save_hdf5(filename)
+    dump_hdf5 = pysplashsph.read.read_hdf5(filename)
+
+    lo = np.array([-0.1, -0.1, -np.inf])
+    hi = np.array([0.2, 0.2, np.inf])
+    radius = 2. * dump_hdf5['h']
+    inside = np.all([(dump_hdf5[label] - radius <= hi[i]) & (dump_hdf5[label] + radius >= lo[i])
+                     for i, label in enumerate(['x', 'y', 'z'])], axis=0)
+
+    assert np.array_equal(dump_hdf5.tree.box(lo, hi), np.flatnonzero(inside))
+
+    # A tree does not load for positions it was not built with
+    with pytest.raises(ValueError):
+        dump.load_tree(filename)
+
+
+def test_read_cache(capfd, tmp_path):
+
+    dump = pysplashsph.read.read_data(test_file_binary, filetype='Phantom')
+
+    for _ in range(2):
+        dump_cached = pysplashsph.read.read_data(test_file_binary, filetype='Phantom',
+                                                 cache=True, cache_dir=str(tmp_path))
+
+        assert dump_cached.labels == dump.labels
+        assert np.array_equal(dump_cached.data, dump.data)
+
+    capfd.readouterr()
+
+    # The second read is memory-mapped from the cache
+    assert isinstance(dump_cached.data, np.memmap)
+    assert len(os.listdir(str(tmp_path))) == 2
+
+
+def test_read_hdf5_phantom():
+
+    # Phantom HDF5 files store massoftype as an array over the types
+    dump = pysplashsph.read.read_hdf5(os.path.join(test_dir, 'data/test_00000.h5'))
+    massoftype = dump.headers['massoftype']
+    itype = dump['itype'].astype(int)
+
+    assert np.allclose(dump['mass'], massoftype[itype - 1])
+    assert np.allclose(dump['density'], massoftype[itype - 1]
+                       * (dump.headers['hfact'] / np.abs(dump['h']))**3)
+
+    image = pysplashsph.interpolation.interpolate3d_projection(dump, npixx=32)
+    assert np.all(np.isfinite(image)) and image.max() > 0.
@@ -0,0 +1,69 @@
+import pysplashsph
+import pytest
+import numpy as np
+import os
+import sys
+
+
+@pytest.mark.parametrize('capture', ['memfd', 'pipe', 'tempfile'])
+def test_stdchannel_redirected(capfd, capture):
+    if capture == 'memfd' and not hasattr(os, 'memfd_create'):
+        pytest.skip("memfd_create is not available")
+
+    # Redirect the current sys.stdout, which pytest may have replaced
+    with pysplashsph.utils.stdchannel_redirected(stdchannel=sys.stdout, capture=capture):
+        os.write(sys.stdout.fileno(), b'Reading dump file\n')
+
+    with pytest.raises(RuntimeError):
+        with pysplashsph.utils.stdchannel_redirected(stdchannel=sys.stdout, capture=capture):
+            os.write(sys.stdout.fileno(), b'ERROR: could not open file\n')
+
+    capfd.readouterr()
+
+
+def test_kdtree():
+    rng = np.random.default_rng(0)
+    positions = rng.normal(size=(3, 5000))
+    h = 0.05 * rng.random(5000)
+
+    tree = pysplashsph.utils.KDTree(positions, h=h, leafsize=16)
+    check_kdtree(tree, positions, h)
+
+
+def test_kdtree_accreted():
+    # Accreted particles have h < 0, and must not shrink the boxes of
+    # the nodes below their own positions
+    rng = np.random.default_rng(1)
+    positions = rng.normal(size=(3, 5000))
+    h = 0.05 * rng.random(5000)
+    h[rng.random(5000) < 0.2] *= -1.
+
+    tree = pysplashsph.utils.KDTree(positions, h=h, leafsize=16)
+    check_kdtree(tree, positions, np.abs(h))
+
+    lo = np.array([-0.5, -0.2, -0.3])
+    hi = np.array([0.3, 0.4, 0.2])
+    inside = np.all((positions <= hi[:, None]) & (positions >= lo[:, None]), axis=0)
+    assert np.array_equal(tree.box(lo, hi, smoothing=False), np.flatnonzero(inside))
+
+    inside = (positions[1] >= -0.1) & (positions[1] <= 0.1)
+    assert np.array_equal(tree.slab(1, -0.1, 0.1, smoothing=False), np.flatnonzero(inside))
+
+
+def check_kdtree(tree, positions, h):
+    """ Compare the queries of a tree with a brute force search. """
+    lo = np.array([-0.5, -0.2, -np.inf])
+    hi = np.array([0.3, 0.4, np.inf])
+    inside = np.all((positions - 2 * h <= hi[:, None]) & (positions + 2 * h >= lo[:, None]), axis=0)
+    assert np.array_equal(tree.box(lo, hi), np.flatnonzero(inside))
+
+    inside = np.abs(positions[2]) <= 2 * h
+    assert np.array_equal(tree.slab(2, 0., 0.), np.flatnonzero(inside))
+
+    for centre in [np.array([0.1, 0.2, -0.1]), np.array([-0.7, 0.4, 0.5])]:
+        inside = np.sum((positions - centre[:, None])**2, axis=0) <= 0.3**2
+        assert np.array_equal(tree.sphere(centre, 0.3), np.flatnonzero(inside))
+
+    for i in [10, 20, 30]:
+        inside = np.sum((positions - positions[:, [i]])**2, axis=0) <= (2 * h[i])**2
+        assert np.array_equal(tree.neighbours(i), np.flatnonzero(inside))